@@ -0,0 +1,95 @@
+"""拼音/错别字搜索的延迟基准
+
+在插件所在的plugins目录下执行：
+    python -m strbot_plugin_play_sy.benchmarks.bench_fuzzy_search
+    python -m strbot_plugin_play_sy.benchmarks.bench_fuzzy_search --memories 500 --rounds 200
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from typing import Callable, List
+
+from ..memory_manager import MemoryManager
+
+NAMES = ["凌风", "苏晴", "林默", "陈曦", "顾川", "叶蓁", "沈砚", "周遥"]
+PLACES = ["重庆", "成都", "杭州", "银行", "图书馆", "海边", "公司", "火锅店"]
+ACTIONS = ["一起吃了饭", "聊了很久的天", "讨论了Python项目", "约好下周再见", "吵了一架",
+           "看了一场电影", "办理了信用卡", "学习了机器学习", "去散步", "庆祝了生日"]
+FEELINGS = ["很开心", "有点难过", "觉得很累", "非常期待", "心情复杂", ""]
+
+# (说明, 关键词)：前两个走精确匹配，其余精确匹配落空后走模糊索引
+QUERIES = [
+    ("精确命中", "凌风"),
+    ("精确多词", "重庆 火锅店"),
+    ("全拼", "lingfeng"),
+    ("同音字", "灵风"),
+    ("多音字", "chongqing"),
+    ("错别字", "机器学系"),
+    ("英文拼错", "pyhton"),
+    ("无结果", "zzzz不存在"),
+]
+
+
+def make_content(rng: random.Random) -> str:
+    return (f"{rng.choice(NAMES)}和{rng.choice(NAMES)}在{rng.choice(PLACES)}"
+            f"{rng.choice(ACTIONS)}，{rng.choice(FEELINGS)}{rng.randint(1, 9999)}")
+
+
+def measure(func: Callable[[], object], rounds: int) -> List[float]:
+    """执行rounds次，返回每次耗时（毫秒）"""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: List[float], extra: str = ""):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<12} p50 {p50:8.3f} ms   p99 {p99:8.3f} ms   {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="拼音/错别字搜索的延迟基准")
+    parser.add_argument("--memories", type=int, default=500, help="每个会话的记忆数")
+    parser.add_argument("--rounds", type=int, default=200, help="每个查询重复次数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    session_id = "bench"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = MemoryManager(os.path.join(tmp_dir, "memory_data.json"), {
+            "max_memories": args.memories,
+            "memory_expire_days": 0,
+            "dedup_enabled": False,
+            "fuzzy_search_enabled": True
+        })
+        for _ in range(args.memories):
+            manager.add_memory(session_id, make_content(rng), rng.randint(1, 5))
+        print(f"会话记忆数: {len(manager.get_memories(session_id))}")
+
+        start = time.perf_counter()
+        manager._ensure_fuzzy_index(session_id)
+        print(f"构建拼音/n-gram索引: {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+        for label, keyword in QUERIES:
+            hits = len(manager.search_memories(session_id, keyword))
+            report(label, measure(lambda: manager.search_memories(session_id, keyword), args.rounds),
+                   f"{hits} 条  ({keyword})")
+
+        # 增量维护：编辑一条记忆要先移出再加入全部索引
+        memories = manager.get_memories(session_id)
+        report("增量编辑", measure(
+            lambda: manager.edit_memory(session_id, rng.randrange(len(memories)), make_content(rng)),
+            args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""端到端压测：模拟多个会话并发调用插件的指令和LLM工具
+
+不依赖AstrBot：astrbot.api 用桩模块代替，事件用 FakeEvent 代替，直接调用 Main 上的处理函数，
+因此测到的是插件自身（会话ID解析、加锁、文本拼接、保存落盘）的开销。
+压测数据写在临时目录里，不会读写插件自己的数据文件。
+
+在插件所在的plugins目录下执行：
+    python -m strbot_plugin_play_sy.benchmarks.load_test
+    python -m strbot_plugin_play_sy.benchmarks.load_test --sessions 100 --ops 50 --mix save=3,get=2,search=3,list=1,edit=1
+"""
+import os
+import sys
+import time
+import types
+import random
+import asyncio
+import argparse
+import tempfile
+import importlib
+import statistics
+from typing import Dict, List
+
+from .bench_fuzzy_search import make_content, NAMES, PLACES
+
+OPERATIONS = ("save", "get", "search", "list", "edit")
+DEFAULT_MIX = "save=3,get=2,search=3,list=1,edit=1"
+
+
+class FakeEvent:
+    """最小化的 AstrMessageEvent 替身"""
+
+    def __init__(self, session_id: str, message_str: str = ""):
+        self.unified_msg_origin = session_id
+        self.session_id = session_id
+        self.message_str = message_str
+
+    def plain_result(self, text: str) -> str:
+        return text
+
+
+class FakeContext:
+    def get_using_provider(self):
+        return None
+
+
+def install_astrbot_stub():
+    """在 sys.modules 中放入 astrbot.api 的桩模块，装饰器都原样返回被装饰的函数"""
+
+    def passthrough(*args, **kwargs):
+        return lambda obj: obj
+
+    class CommandGroup:
+        def __init__(self, func):
+            self.func = func
+
+        def command(self, *args, **kwargs):
+            return lambda func: func
+
+    class Star:
+        def __init__(self, context):
+            self.context = context
+
+    modules = {name: types.ModuleType(name) for name in
+               ("astrbot", "astrbot.api", "astrbot.api.event", "astrbot.api.event.filter", "astrbot.api.star")}
+    modules["astrbot.api"].llm_tool = passthrough
+    modules["astrbot.api.event"].AstrMessageEvent = FakeEvent
+    modules["astrbot.api.event"].MessageEventResult = str
+    modules["astrbot.api.event.filter"].command = passthrough
+    modules["astrbot.api.event.filter"].command_group = lambda *args, **kwargs: CommandGroup
+    modules["astrbot.api.star"].Context = FakeContext
+    modules["astrbot.api.star"].Star = Star
+    modules["astrbot.api.star"].register = passthrough
+    sys.modules.update(modules)
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """解析 save=3,get=2 这样的操作权重"""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"未知操作: {name}（可选 {', '.join(OPERATIONS)}）")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def percentile(samples: List[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def monitor_loop_lag(interval: float, lags: List[float], stop: asyncio.Event):
+    """定时醒来，记录实际醒来时间比预期晚了多少（毫秒）"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(loop.time() - expected, 0) * 1000)
+
+
+async def run_operation(plugin, op: str, event: FakeEvent, rng: random.Random):
+    session_id = event.unified_msg_origin
+    if op == "save":
+        await plugin.save_memory(event, make_content(rng), rng.randint(3, 5))
+    elif op == "get":
+        await plugin.get_memories(event)
+    elif op == "search":
+        await plugin.search_memories_tool(event, f"{rng.choice(NAMES)} {rng.choice(PLACES)}")
+    elif op == "list":
+        event.message_str = "/memory list"
+        await plugin.list_memories(event)
+    elif op == "edit":
+        count = len(plugin.memory_manager.get_memories(session_id))
+        content = make_content(rng)
+        event.message_str = f"/memory edit 1 {content}"
+        await plugin.edit_memory(event, rng.randint(1, count) if count else 1, content)
+
+
+async def session_worker(plugin, session_id: str, ops: int, mix: Dict[str, int], think: float,
+                         rng: random.Random, latencies: Dict[str, List[float]], errors: Dict[str, int]):
+    names, weights = list(mix), list(mix.values())
+    event = FakeEvent(session_id)
+    for _ in range(ops):
+        op = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            await run_operation(plugin, op, event, rng)
+        except Exception as e:
+            errors[op] = errors.get(op, 0) + 1
+            print(f"[{op}] {session_id}: {e!r}", file=sys.stderr)
+        latencies[op].append((time.perf_counter() - start) * 1000)
+        if think:
+            await asyncio.sleep(rng.uniform(0, think * 2))
+
+
+async def run_load_test(args) -> int:
+    install_astrbot_stub()
+    package = __package__.rsplit(".", 1)[0]
+    main_module = importlib.import_module(f"{package}.main")
+    MemoryManager = importlib.import_module(f"{package}.memory_manager").MemoryManager
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Main 固定使用 data/memories 下的数据文件，这里让它改用临时目录
+        data_file = os.path.join(tmp_dir, "memory_data.json")
+        main_module.MemoryManager = lambda _, config: MemoryManager(data_file, config)
+        plugin = main_module.Main(FakeContext(), {
+            "max_memories": args.max_memories,
+            "memory_expire_days": 0,
+            "importance_threshold": 3
+        })
+        # 后台整理任务对压测没有意义，在它开始运行前停掉
+        plugin._consolidation_task.cancel()
+
+        session_ids = [f"load_test:session_{i}" for i in range(args.sessions)]
+        for session_id in session_ids:
+            for _ in range(args.preload):
+                plugin.memory_manager.add_memory(session_id, make_content(rng), rng.randint(1, 5))
+        await plugin.memory_manager.save_memories()
+
+        latencies: Dict[str, List[float]] = {op: [] for op in mix}
+        errors: Dict[str, int] = {}
+        lags: List[float] = []
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(monitor_loop_lag(args.lag_interval / 1000, lags, stop))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            session_worker(plugin, session_id, args.ops, mix, args.think_ms / 1000,
+                           random.Random(rng.random()), latencies, errors)
+            for session_id in session_ids
+        ))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await monitor
+        cache = plugin.response_cache.stats()
+        await plugin.terminate()
+
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"会话数 {args.sessions}，每会话 {args.ops} 次操作，预置 {args.preload} 条记忆，操作比例 {args.mix}")
+    print(f"总计 {total} 次操作，耗时 {elapsed:.2f} s，吞吐 {total / elapsed:.1f} ops/s\n")
+    print(f"{'操作':<8}{'次数':>8}{'p50(ms)':>12}{'p99(ms)':>12}{'max(ms)':>12}{'错误':>8}")
+    for op, samples in latencies.items():
+        if samples:
+            print(f"{op:<8}{len(samples):>8}{statistics.median(samples):>12.2f}"
+                  f"{percentile(samples, 0.99):>12.2f}{max(samples):>12.2f}{errors.get(op, 0):>8}")
+    if lags:
+        print(f"\n事件循环延迟（每 {args.lag_interval} ms 采样）: p50 {statistics.median(lags):.2f} ms, "
+              f"p99 {percentile(lags, 0.99):.2f} ms, max {max(lags):.2f} ms")
+    print(f"工具响应缓存命中率: {cache['hit_rate']:.1%} ({cache['hits']}/{cache['hits'] + cache['misses']})")
+    return 1 if errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="插件端到端压测")
+    parser.add_argument("--sessions", type=int, default=50, help="并发会话数")
+    parser.add_argument("--ops", type=int, default=40, help="每个会话执行的操作数")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"操作比例，默认 {DEFAULT_MIX}")
+    parser.add_argument("--preload", type=int, default=50, help="每个会话预置的记忆数")
+    parser.add_argument("--max-memories", type=int, default=100, help="每个会话最大记忆数")
+    parser.add_argument("--think-ms", type=float, default=0, help="两次操作之间的平均间隔（毫秒）")
+    parser.add_argument("--lag-interval", type=float, default=5, help="事件循环延迟采样间隔（毫秒）")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run_load_test(args)))
+
+
+if __name__ == "__main__":
+    main()
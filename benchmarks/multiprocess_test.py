@@ -0,0 +1,239 @@
+"""多进程共享模式的一致性测试
+
+1. 回滚场景：同一个数据库上开两个 MemoryManager（各自一条SQLite连接，相当于两个进程）。
+   A 的写事务在归档时失败回滚，随后 B 写入会话 y，A 再写入会话 y，检查 B 的改动没有被
+   A 覆盖，且 A 回滚时排队的归档记录没有被再写一次。
+   取消场景：B 持有写锁时 A 的写事务在等锁期间被取消，B 释放写锁后 A 的连接不应残留事务，
+   A 和 B 都还能继续写入。
+2. 并发场景：启动多个进程反复往同一批会话里添加记忆（每会话容量较小，会不断淘汰进归档），
+   按比例注入归档失败让事务回滚。结束后检查每条提交成功的记忆恰好出现一次（热数据或归档），
+   回滚掉的记忆一条都不出现，会话内 memory_id 唯一且不超过容量。
+
+在插件所在的plugins目录下执行：
+    python -m strbot_plugin_play_sy.benchmarks.multiprocess_test
+    python -m strbot_plugin_play_sy.benchmarks.multiprocess_test --procs 8 --sessions 3 --ops 300
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from ..memory_manager import MemoryManager
+from .bench_fuzzy_search import make_content
+
+
+def shared_config(max_memories: int) -> Dict:
+    return {
+        "multi_process_mode": True,
+        "max_memories": max_memories,
+        "memory_expire_days": 0,
+        "dedup_enabled": False
+    }
+
+
+def failing_append(batches):
+    raise OSError("注入的归档写入失败")
+
+
+def read_archive(manager: MemoryManager, session_id: str) -> List[Dict]:
+    """读出会话归档里的全部记录（归档文件由多个gzip成员组成，gzip.open会依次读完）"""
+    data_path, _ = manager.archive._paths(session_id)
+    if not os.path.exists(data_path):
+        return []
+    with gzip.open(data_path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def check_rollback(data_file: str) -> List[str]:
+    problems = []
+    config = shared_config(2)
+    a = MemoryManager(data_file, config)
+    b = MemoryManager(data_file, config)
+
+    async with a.session_lock("x"):
+        a.add_memory("x", "回滚测试第一条", 1)
+        a.add_memory("x", "回滚测试第二条", 2)
+
+    # 会话已满，再加一条会淘汰一条进归档；归档写入失败，整个事务回滚
+    a.archive.append = failing_append
+    try:
+        async with a.session_lock("x"):
+            a.add_memory("x", "回滚测试第三条", 3)
+        problems.append("归档写入失败时事务没有回滚")
+    except OSError:
+        pass
+    del a.archive.append
+    if a._archive_pending.get("x"):
+        problems.append(f"回滚后仍有 {len(a._archive_pending['x'])} 条待归档记录")
+    # 直接看内存里的数据：get_memories 会顺带同步一次，掩盖版本号的问题
+    contents = [m["content"] for m in a.memories.get("x", [])]
+    if contents != ["回滚测试第一条", "回滚测试第二条"]:
+        problems.append(f"回滚后会话 x 的热数据不对: {contents}")
+
+    async with b.session_lock("y"):
+        b.add_memory("y", "进程B写入的记忆", 3)
+    async with a.session_lock("y"):
+        a.add_memory("y", "进程A写入的记忆", 3)
+    # 这次淘汰成功，归档里应当只有这一条
+    async with a.session_lock("x"):
+        a.add_memory("x", "回滚测试第四条", 4)
+
+    c = MemoryManager(data_file, config)
+    contents = sorted(m["content"] for m in c.get_memories("y"))
+    if contents != ["进程A写入的记忆", "进程B写入的记忆"]:
+        problems.append(f"会话 y 丢失了其他进程的写入: {contents}")
+    archived = [record["content"] for record in read_archive(c, "x")]
+    if archived != ["回滚测试第一条"]:
+        problems.append(f"会话 x 的归档记录不对: {archived}")
+    for manager in (a, b, c):
+        manager.store.close()
+    return problems
+
+
+async def check_cancel(data_file: str) -> List[str]:
+    problems = []
+    config = shared_config(20)
+    a = MemoryManager(data_file, config)
+    b = MemoryManager(data_file, config)
+
+    async def write_a():
+        async with a.session_lock("x"):
+            a.add_memory("x", "等锁时被取消的写入", 3)
+
+    b.store.begin()
+    task = asyncio.create_task(write_a())
+    # 让 A 的 BEGIN IMMEDIATE 在线程里等 B 的写锁
+    await asyncio.sleep(0.2)
+    task.cancel()
+    await asyncio.sleep(0.1)
+    b.store.rollback()
+    try:
+        await task
+        problems.append("等锁时取消没有生效")
+    except asyncio.CancelledError:
+        pass
+    if a.store.conn.in_transaction:
+        problems.append("取消后 A 的连接仍残留未结束的事务")
+        a.store.rollback()
+
+    try:
+        async with b.session_lock("x"):
+            b.add_memory("x", "取消之后B的写入", 3)
+        async with a.session_lock("x"):
+            a.add_memory("x", "取消之后A的写入", 3)
+    except Exception as e:
+        problems.append(f"取消之后无法继续写入: {e!r}")
+    contents = sorted(m["content"] for m in a.get_memories("x"))
+    if contents != ["取消之后A的写入", "取消之后B的写入"]:
+        problems.append(f"取消之后会话 x 的数据不对: {contents}")
+    for manager in (a, b):
+        manager.store.close()
+    return problems
+
+
+async def hammer(data_file: str, worker_id: int, sessions: int, ops: int, max_memories: int,
+                 fail_rate: float, seed: int) -> Tuple[List[str], List[str]]:
+    manager = MemoryManager(data_file, shared_config(max_memories))
+    rng = random.Random(seed)
+    committed, failed = [], []
+    for i in range(ops):
+        session_id = f"mp_test:session_{rng.randrange(sessions)}"
+        content = f"进程{worker_id}第{i}条 {make_content(rng)}"
+        if rng.random() < fail_rate:
+            manager.archive.append = failing_append
+        try:
+            async with manager.session_lock(session_id):
+                manager.add_memory(session_id, content, rng.randint(1, 5))
+        except OSError:
+            failed.append(content)
+        else:
+            committed.append(content)
+        finally:
+            vars(manager.archive).pop("append", None)
+    manager.store.close()
+    return committed, failed
+
+
+def run_worker(*args) -> Tuple[List[str], List[str]]:
+    return asyncio.run(hammer(*args))
+
+
+def check_hammer(data_file: str, max_memories: int, committed: List[str], failed: List[str]) -> List[str]:
+    problems = []
+    manager = MemoryManager(data_file, shared_config(max_memories))
+    seen = Counter()
+    for session_id, memories in manager.memories.items():
+        if len(memories) > max_memories:
+            problems.append(f"{session_id}: {len(memories)} 条，超过容量 {max_memories}")
+        ids = Counter(m["memory_id"] for m in memories)
+        duplicated_ids = [memory_id for memory_id, count in ids.items() if count > 1]
+        if duplicated_ids:
+            problems.append(f"{session_id}: memory_id 重复 {duplicated_ids[:3]}")
+        seen.update(m["content"] for m in memories)
+        seen.update(record["content"] for record in read_archive(manager, session_id))
+    manager.store.close()
+
+    lost = [content for content in committed if not seen[content]]
+    duplicated = [content for content, count in seen.items() if count > 1]
+    resurrected = [content for content in failed if seen[content]]
+    unknown = set(seen) - set(committed) - set(failed)
+    for label, items in (("提交成功却丢失", lost), ("出现不止一次", duplicated),
+                         ("已回滚却被写入", resurrected), ("来源不明", unknown)):
+        if items:
+            problems.append(f"{len(items)} 条记忆{label}，例如: {list(items)[:3]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程共享模式的一致性测试")
+    parser.add_argument("--procs", type=int, default=4, help="并发进程数")
+    parser.add_argument("--sessions", type=int, default=3, help="共享的会话数")
+    parser.add_argument("--ops", type=int, default=200, help="每个进程的写入次数")
+    parser.add_argument("--max-memories", type=int, default=20, help="每个会话最大记忆数")
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="注入归档失败的比例")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(os.path.join(tmp_dir, "rollback"))
+        problems = asyncio.run(check_rollback(os.path.join(tmp_dir, "rollback", "memory_data.json")))
+        print(f"回滚场景: {'通过' if not problems else '失败'}")
+        os.makedirs(os.path.join(tmp_dir, "cancel"))
+        cancel_problems = asyncio.run(check_cancel(os.path.join(tmp_dir, "cancel", "memory_data.json")))
+        print(f"取消场景: {'通过' if not cancel_problems else '失败'}")
+        problems += cancel_problems
+
+        data_file = os.path.join(tmp_dir, "memory_data.json")
+        # 先建好数据库，避免各进程同时做首次迁移
+        MemoryManager(data_file, shared_config(args.max_memories)).store.close()
+        start = time.perf_counter()
+        with ProcessPoolExecutor(args.procs, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(run_worker, data_file, worker_id, args.sessions, args.ops,
+                                   args.max_memories, args.fail_rate, args.seed + worker_id)
+                       for worker_id in range(args.procs)]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+        committed = [content for done, _ in results for content in done]
+        failed = [content for _, rolled_back in results for content in rolled_back]
+        hammer_problems = check_hammer(data_file, args.max_memories, committed, failed)
+        print(f"并发场景: {args.procs} 个进程 × {args.ops} 次写入，{args.sessions} 个会话，"
+              f"提交 {len(committed)} 次，回滚 {len(failed)} 次，耗时 {elapsed:.2f} s: "
+              f"{'通过' if not hammer_problems else '失败'}")
+        problems += hammer_problems
+
+    for problem in problems:
+        print(f"  - {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""并发一致性压测：大量交错调用插件的指令和LLM工具，结束后检查内部状态是否自洽
+
+同一会话上同时跑多个协程，保存、编辑、删除、清空、整理、导入导出、按时间清理等操作交错进行，
+每会话容量和全局容量都设得较小，淘汰和跨会话淘汰会频繁发生。全部调用结束后检查：
+    - 数据文件（共享模式下为SQLite）与内存中的数据一致
+    - 会话内 memory_id 唯一，记忆数不超过每会话上限，总数不超过全局上限
+    - 已构建的ID、SimHash、标签、时间、拼音索引与记忆列表一致
+    - total_records / total_bytes 及每会话用量与重新统计的结果一致
+任何一项不满足或处理函数抛出异常时退出码为1。
+
+在插件所在的plugins目录下执行：
+    python -m strbot_plugin_play_sy.benchmarks.stress_test
+    python -m strbot_plugin_play_sy.benchmarks.stress_test --sessions 8 --workers 4 --ops 200
+    python -m strbot_plugin_play_sy.benchmarks.stress_test --shared
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import importlib
+from collections import Counter
+from typing import List
+
+from .bench_fuzzy_search import make_content, NAMES, PLACES
+from .load_test import FakeEvent, FakeContext, install_astrbot_stub
+
+# 操作 -> 权重
+OPERATIONS = {
+    "save": 8, "add": 4, "edit": 3, "remove": 3, "update": 3,
+    "get": 3, "search": 3, "search_cmd": 2, "list": 2, "tag": 2, "between": 2,
+    "stats": 1, "stats_tool": 1, "deep_search": 1, "dedup": 1,
+    "consolidate": 1, "export_import": 1, "clear_old": 1, "clear": 1
+}
+
+
+async def run_operation(plugin, op: str, session_id: str, recent: List[str], rng: random.Random):
+    event = FakeEvent(session_id)
+    count = len(plugin.memory_manager.memories.get(session_id, []))
+    index = rng.randint(1, count) if count else 1
+    if op in ("save", "add", "edit"):
+        # 一部分内容与最近保存过的重复，触发近似去重合并
+        content = rng.choice(recent) if recent and rng.random() < 0.2 else make_content(rng)
+        recent.append(content)
+        del recent[:-20]
+    if op == "save":
+        await plugin.save_memory(event, content, rng.randint(3, 5), rng.choice([None, "人物:凌风", "事件:测试,地点:家"]))
+    elif op == "add":
+        event.message_str = f"/memory add {content}"
+        await plugin.add_memory(event, content, rng.randint(1, 5))
+    elif op == "edit":
+        event.message_str = f"/memory edit {index} {content}"
+        await plugin.edit_memory(event, index, content)
+    elif op == "remove":
+        await plugin.remove_memory(event, index)
+    elif op == "update":
+        await plugin.update_memory_importance(event, index, rng.randint(1, 5))
+    elif op == "get":
+        await plugin.get_memories(event, rng.choice([0, 5]))
+    elif op == "search":
+        await plugin.search_memories_tool(event, rng.choice([rng.choice(NAMES), rng.choice(PLACES), "lingfeng"]))
+    elif op == "search_cmd":
+        keyword = rng.choice(["", "--archive "]) + f"{rng.choice(NAMES)} {rng.choice(PLACES)}"
+        event.message_str = f"/memory search {keyword}"
+        await plugin.search_memories(event, keyword.split()[0])
+    elif op == "list":
+        event.message_str = "/memory list"
+        await plugin.list_memories(event, rng.choice(["", "--since"]), "1h")
+    elif op == "tag":
+        await plugin.search_memories_by_tag_tool(event, rng.choice(["人物:*", "地点:户外 OR 事件:测试", "NOT 人物:凌风"]))
+    elif op == "between":
+        await plugin.get_memories_between(event, rng.choice(["1h", "1d"]))
+    elif op == "stats":
+        await plugin.memory_stats(event)
+    elif op == "stats_tool":
+        await plugin.get_memory_stats_tool(event)
+    elif op == "deep_search":
+        await plugin.deep_search_tool(event, rng.choice(NAMES))
+    elif op == "dedup":
+        await plugin.dedup_report(event)
+    elif op == "consolidate":
+        await plugin.consolidate_memories(event)
+    elif op == "export_import":
+        result = await plugin.export_memories(event)
+        if "/memory import " in result:
+            await plugin.import_memories(event, result.rsplit("/memory import ", 1)[1].split()[0])
+    elif op == "clear_old":
+        await plugin.clear_old_memories(event, 0)
+    elif op == "clear":
+        await plugin.clear_memories(event)
+
+
+async def worker(plugin, session_id: str, ops: int, rng: random.Random,
+                 counts: Counter, errors: List[str]):
+    names, weights = list(OPERATIONS), list(OPERATIONS.values())
+    recent: List[str] = []
+    for _ in range(ops):
+        op = rng.choices(names, weights)[0]
+        counts[op] += 1
+        try:
+            await run_operation(plugin, op, session_id, recent, rng)
+        except Exception as e:
+            errors.append(f"[{op}] {session_id}: {e!r}")
+        # 偶尔让出事件循环，打乱各协程的执行顺序
+        if rng.random() < 0.3:
+            await asyncio.sleep(0)
+
+
+def check_invariants(manager, data_file: str) -> List[str]:
+    """检查记忆数据、索引和用量统计是否一致，返回发现的问题"""
+    package = __package__.rsplit(".", 1)[0]
+    simhash = importlib.import_module(f"{package}.simhash_index").simhash
+    parse_timestamp = importlib.import_module(f"{package}.time_index").parse_timestamp
+
+    problems = []
+    if manager.store is not None:
+        # 共享存储里被清空的会话保留一行空列表
+        on_disk = manager.store.load_all()
+        in_memory = {session_id: memories for session_id, memories in manager.memories.items() if memories}
+        if on_disk != in_memory:
+            problems.append("共享存储与内存中的数据不一致")
+    else:
+        with open(data_file, "r", encoding='utf-8') as f:
+            if json.load(f) != manager.memories:
+                problems.append("数据文件与内存中的数据不一致")
+
+    max_memories = manager.config.get("max_memories", 100)
+    # 共享模式下不做跨会话淘汰，全局上限不生效
+    max_records = manager.config.get("global_max_memories", 0) if manager.store is None else 0
+    if max_records and manager.total_records > max_records:
+        problems.append(f"总记忆数 {manager.total_records} 超过全局上限 {max_records}")
+
+    total_records = total_bytes = 0
+    for session_id, memories in manager.memories.items():
+        if len(memories) > max_memories:
+            problems.append(f"{session_id}: {len(memories)} 条，超过每会话上限 {max_memories}")
+        by_id = {m["memory_id"]: m for m in memories}
+        if len(by_id) != len(memories):
+            duplicated = [mid for mid, n in Counter(m["memory_id"] for m in memories).items() if n > 1]
+            problems.append(f"{session_id}: memory_id 重复 {duplicated[:3]}")
+
+        usage = (len(memories), sum(manager._memory_size(m) for m in memories))
+        total_records += usage[0]
+        total_bytes += usage[1]
+        if manager._session_usage.get(session_id) != usage:
+            problems.append(f"{session_id}: 用量统计 {manager._session_usage.get(session_id)}，重新统计为 {usage}")
+
+        if session_id not in manager._id_index:
+            continue
+        id_index = manager._id_index[session_id]
+        if id_index.keys() != by_id.keys() or any(id_index[mid] is not m for mid, m in by_id.items()):
+            problems.append(f"{session_id}: ID索引与记忆列表不一致")
+        fingerprints = manager._simhash_indexes[session_id].fingerprints
+        if fingerprints != {mid: simhash(m["content"]) for mid, m in by_id.items()}:
+            problems.append(f"{session_id}: SimHash索引与记忆内容不一致")
+        tag_index = manager._tag_indexes[session_id]
+        expected_tags = Counter(tag for m in memories for tag in set(m.get("tags", ["其他"])))
+        if tag_index.slots.keys() != by_id.keys() or tag_index.tag_counts() != dict(expected_tags):
+            problems.append(f"{session_id}: 标签索引与记忆标签不一致")
+        expected_times = sorted((parse_timestamp(m["timestamp"]), mid) for mid, m in by_id.items()
+                                if parse_timestamp(m["timestamp"]) is not None)
+        if manager._time_indexes[session_id].entries != expected_times:
+            problems.append(f"{session_id}: 时间索引与记忆时间不一致")
+        fuzzy_index = manager._fuzzy_indexes.get(session_id)
+        if fuzzy_index is not None and fuzzy_index.texts != {mid: m["content"].lower() for mid, m in by_id.items()}:
+            problems.append(f"{session_id}: 拼音索引与记忆内容不一致")
+
+    stale = [sid for sid in manager._id_index if sid not in manager.memories and manager._id_index[sid]]
+    if stale:
+        problems.append(f"已删除的会话仍有索引: {stale[:3]}")
+    stale = [sid for sid, usage in manager._session_usage.items() if sid not in manager.memories and usage != (0, 0)]
+    if stale:
+        problems.append(f"已删除的会话仍计入用量: {stale[:3]}")
+    if set(manager.last_access) != set(manager.memories):
+        problems.append("访问记录中的会话与实际会话不一致")
+    if (manager.total_records, manager.total_bytes) != (total_records, total_bytes):
+        problems.append(f"全局用量 ({manager.total_records}, {manager.total_bytes})，"
+                        f"重新统计为 ({total_records}, {total_bytes})")
+    return problems
+
+
+async def run_stress_test(args) -> int:
+    install_astrbot_stub()
+    package = __package__.rsplit(".", 1)[0]
+    main_module = importlib.import_module(f"{package}.main")
+    MemoryManager = importlib.import_module(f"{package}.memory_manager").MemoryManager
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 与 load_test 相同，让 Main 把数据写在临时目录里
+        data_file = os.path.join(tmp_dir, "memory_data.json")
+        main_module.MemoryManager = lambda _, config: MemoryManager(data_file, config)
+        plugin = main_module.Main(FakeContext(), {
+            "max_memories": args.max_memories,
+            "global_max_memories": args.global_max_memories,
+            "memory_expire_days": 0,
+            "importance_threshold": 3,
+            "multi_process_mode": args.shared
+        })
+        plugin._consolidation_task.cancel()
+        plugin.export_dir = os.path.join(tmp_dir, "exports")
+        plugin.consolidator.state_file = os.path.join(tmp_dir, "consolidation_state.json")
+
+        counts: Counter = Counter()
+        errors: List[str] = []
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            worker(plugin, f"stress_test:session_{i}", args.ops, random.Random(rng.random()), counts, errors)
+            for i in range(args.sessions) for _ in range(args.workers)
+        ))
+        elapsed = time.perf_counter() - start
+
+        manager = plugin.memory_manager
+        await manager.save_memories()
+        problems = check_invariants(manager, data_file)
+        await plugin.terminate()
+
+    total = sum(counts.values())
+    print(f"{'共享模式，' if args.shared else ''}{args.sessions} 个会话 × {args.workers} 个并发协程 × {args.ops} 次操作，共 {total} 次，耗时 {elapsed:.2f} s")
+    print("  " + "，".join(f"{op} {counts[op]}" for op in OPERATIONS))
+    print(f"结束时 {len(manager.memories)} 个会话，{manager.total_records} 条记忆")
+    for error in errors[:20]:
+        print(f"  异常 {error}", file=sys.stderr)
+    for problem in problems:
+        print(f"  - {problem}", file=sys.stderr)
+    print("通过" if not errors and not problems else f"失败: {len(errors)} 次异常，{len(problems)} 项检查不通过")
+    return 1 if errors or problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发一致性压测")
+    parser.add_argument("--sessions", type=int, default=8, help="会话数")
+    parser.add_argument("--workers", type=int, default=4, help="每个会话的并发协程数")
+    parser.add_argument("--ops", type=int, default=150, help="每个协程执行的操作数")
+    parser.add_argument("--max-memories", type=int, default=30, help="每个会话最大记忆数")
+    parser.add_argument("--global-max-memories", type=int, default=120, help="全局最大记忆数")
+    parser.add_argument("--shared", action="store_true", help="使用多进程共享模式（SQLite）")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run_stress_test(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -28,7 +28,7 @@ class ConfigManager:
         # 验证最大记忆数
         if "max_memories" in config:
             max_memories = config["max_memories"]
-            if isinstance(max_memories, int) and 1 <= max_memories <= 100:
+            if isinstance(max_memories, int) and 1 <= max_memories <= 500:
                 validated["max_memories"] = max_memories
             else:
                 logger.warning(f"无效的max_memories值: {max_memories}，使用默认值")
@@ -70,6 +70,64 @@ class ConfigManager:
                 logger.warning(f"无效的enable_memory_management值: {enable}，使用默认值")
                 validated["enable_memory_management"] = self.default_config["enable_memory_management"]
         
+        # 验证近似去重开关
+        if "dedup_enabled" in config:
+            enable = config["dedup_enabled"]
+            if isinstance(enable, bool):
+                validated["dedup_enabled"] = enable
+            else:
+                logger.warning(f"无效的dedup_enabled值: {enable}，使用默认值")
+                validated["dedup_enabled"] = self.default_config["dedup_enabled"]
+        
+        # 验证近似去重阈值
+        if "dedup_threshold" in config:
+            threshold = config["dedup_threshold"]
+            if isinstance(threshold, (int, float)) and not isinstance(threshold, bool) and 0.5 <= threshold <= 1:
+                validated["dedup_threshold"] = float(threshold)
+            else:
+                logger.warning(f"无效的dedup_threshold值: {threshold}，使用默认值")
+                validated["dedup_threshold"] = self.default_config["dedup_threshold"]
+        
+        # 验证去重演练模式开关
+        if "dedup_dry_run" in config:
+            dry_run = config["dedup_dry_run"]
+            if isinstance(dry_run, bool):
+                validated["dedup_dry_run"] = dry_run
+            else:
+                logger.warning(f"无效的dedup_dry_run值: {dry_run}，使用默认值")
+                validated["dedup_dry_run"] = self.default_config["dedup_dry_run"]
+        
+        # 验证记忆整理、多进程共享模式、模糊搜索和归档开关
+        for key in ("consolidation_enabled", "consolidation_use_llm", "multi_process_mode", "fuzzy_search_enabled",
+                    "archive_enabled"):
+            if key in config:
+                value = config[key]
+                if isinstance(value, bool):
+                    validated[key] = value
+                else:
+                    logger.warning(f"无效的{key}值: {value}，使用默认值")
+                    validated[key] = self.default_config[key]
+        
+        # 验证记忆整理、全局预算、搜索片段和缓存的数值参数
+        ranges = {
+            "global_max_memories": (0, 1000000),
+            "global_max_mb": (0, 10240),
+            "consolidation_interval_minutes": (1, 10080),
+            "consolidation_max_importance": (1, 4),
+            "consolidation_window_hours": (1, 720),
+            "consolidation_min_cluster_size": (2, 50),
+            "snippet_width": (10, 200),
+            "tool_cache_size": (0, 10000)
+        }
+        for key, (low, high) in ranges.items():
+            if key in config:
+                value = config[key]
+                if isinstance(value, int) and low <= value <= high:
+                    validated[key] = value
+                else:
+                    logger.warning(f"无效的{key}值: {value}，使用默认值")
+                    validated[key] = self.default_config[key]
+        
         return validated
     
     def get_config(self) -> Dict[str, Any]:
@@ -94,5 +152,16 @@ class ConfigManager:
         summary += f"• 自动保存: {'启用' if config.get('auto_save_enabled', True) else '禁用'}\n"
         summary += f"• 重要性阈值: {config.get('importance_threshold', 3)}/5\n"
         summary += f"• 过期天数: {config.get('memory_expire_days', 30)}天\n"
-        summary += f"• 记忆管理: {'启用' if config.get('enable_memory_management', True) else '禁用'}"
+        summary += f"• 记忆管理: {'启用' if config.get('enable_memory_management', True) else '禁用'}\n"
+        dedup_mode = "演练" if config.get('dedup_dry_run', False) else "合并"
+        summary += f"• 近似去重: {'启用' if config.get('dedup_enabled', True) else '禁用'} (阈值 {config.get('dedup_threshold', 0.85)}, {dedup_mode}模式)\n"
+        summary += f"• 记忆整理: {'启用' if config.get('consolidation_enabled', False) else '禁用'} (每{config.get('consolidation_interval_minutes', 60)}分钟, {config.get('consolidation_max_importance', 3)}星及以下)\n"
+        summary += f"• 多进程共享: {'启用' if config.get('multi_process_mode', False) else '禁用'}\n"
+        summary += f"• 拼音/近似搜索: {'启用' if config.get('fuzzy_search_enabled', True) else '禁用'}\n"
+        summary += f"• 冷数据归档: {'启用' if config.get('archive_enabled', True) else '禁用'}\n"
+        cache_size = config.get('tool_cache_size', 256)
+        summary += f"• 工具响应缓存: {f'{cache_size}条' if cache_size else '禁用'}\n"
+        global_records = config.get('global_max_memories', 0)
+        global_mb = config.get('global_max_mb', 0)
+        summary += f"• 全局预算: {f'{global_records}条' if global_records else '不限条数'}, {f'{global_mb}MB' if global_mb else '不限大小'}"
         return summary 
\ No newline at end of file
@@ -0,0 +1,246 @@
+import os
+import re
+import json
+import asyncio
+import datetime
+import logging
+from collections import Counter
+from typing import List, Dict, Optional
+
+from .memory_manager import atomic_write_text
+
+logger = logging.getLogger("astrbot")
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_SENTENCE_SPLIT = re.compile(r"[。！？!?；;\n]+")
+
+
+class ExtractiveSummarizer:
+    """本地抽取式摘要器
+
+    把一组记忆切成句子，按句子与整组内容的字符二元组重合度打分，
+    挑出最有代表性的句子按原顺序拼接，不依赖任何外部服务。
+    """
+
+    def __init__(self, max_length: int = 200):
+        self.max_length = max_length
+
+    def _summarize(self, memories: List[Dict]) -> str:
+        sentences = []
+        for memory in memories:
+            for sentence in _SENTENCE_SPLIT.split(memory["content"]):
+                sentence = sentence.strip()
+                if sentence and sentence not in sentences:
+                    sentences.append(sentence)
+        if not sentences:
+            return ""
+
+        def bigrams(text: str) -> List[str]:
+            return [text[i:i + 2] for i in range(len(text) - 1)] or [text]
+
+        frequency = Counter(bg for sentence in sentences for bg in set(bigrams(sentence)))
+        scores = {
+            i: sum(frequency[bg] for bg in set(bigrams(s))) / len(set(bigrams(s)))
+            for i, s in enumerate(sentences)
+        }
+
+        chosen = []
+        length = 0
+        for i in sorted(scores, key=lambda i: scores[i], reverse=True):
+            if chosen and length + len(sentences[i]) > self.max_length:
+                continue
+            chosen.append(i)
+            length += len(sentences[i]) + 1
+        return "；".join(sentences[i] for i in sorted(chosen))
+
+    async def summarize(self, memories: List[Dict]) -> str:
+        """生成摘要（在线程池中计算，不阻塞事件循环）"""
+        return await asyncio.to_thread(self._summarize, memories)
+
+
+class LLMSummarizer:
+    """通过AstrBot当前使用的LLM提供商生成摘要，不可用时退回本地摘要器"""
+
+    PROMPT = (
+        "下面是同一主题下的若干条零散记忆，请把它们合并成一条简洁的记忆，"
+        "保留人物、地点、事件等关键信息，不要添加原文没有的内容，只输出合并后的记忆：\n{memories}"
+    )
+
+    def __init__(self, context, fallback: Optional[ExtractiveSummarizer] = None):
+        self.context = context
+        self.fallback = fallback or ExtractiveSummarizer()
+
+    async def summarize(self, memories: List[Dict]) -> str:
+        provider = self.context.get_using_provider()
+        if provider is None:
+            logger.warning("[Consolidator] 没有可用的LLM提供商，使用本地摘要")
+            return await self.fallback.summarize(memories)
+
+        lines = "\n".join(f"- [{m['timestamp']}] {m['content']}" for m in memories)
+        try:
+            response = await provider.text_chat(prompt=self.PROMPT.format(memories=lines), contexts=[])
+            summary = (response.completion_text or "").strip()
+        except Exception as e:
+            logger.error(f"[Consolidator] LLM摘要失败，使用本地摘要: {e}")
+            return await self.fallback.summarize(memories)
+        return summary or await self.fallback.summarize(memories)
+
+
+class MemoryConsolidator:
+    """低重要性记忆整理器
+
+    按时间窗口和标签把低重要性记忆聚成簇，每簇替换成一条摘要记忆。
+    摘要器只需要实现 `async summarize(memories) -> str`，可以替换成任何实现。
+    一轮整理的进度写入状态文件，进程中途退出后下次会从未完成的会话继续。
+    """
+
+    def __init__(self, memory_manager, summarizer, state_file: str, batch_size: int = 20):
+        self.memory_manager = memory_manager
+        self.summarizer = summarizer
+        self.state_file = state_file
+        self.batch_size = batch_size
+
+    @property
+    def config(self) -> dict:
+        return self.memory_manager.config
+
+    def _load_state(self) -> Dict:
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r", encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"[Consolidator] 加载整理进度失败: {e}")
+            return {}
+
+    def _save_state(self, state: Dict):
+        try:
+            atomic_write_text(self.state_file, json.dumps(state, ensure_ascii=False))
+        except Exception as e:
+            logger.error(f"[Consolidator] 保存整理进度失败: {e}")
+
+    def find_clusters(self, memories: List[Dict]) -> List[List[Dict]]:
+        """把低重要性记忆按时间窗口和标签聚簇"""
+        max_importance = self.config.get("consolidation_max_importance", 3)
+        window_seconds = self.config.get("consolidation_window_hours", 24) * 3600
+        min_size = self.config.get("consolidation_min_cluster_size", 3)
+
+        windows: Dict[int, List[Dict]] = {}
+        for memory in memories:
+            if memory["importance"] > max_importance:
+                continue
+            try:
+                memory_time = datetime.datetime.strptime(memory["timestamp"], TIME_FORMAT)
+            except:
+                continue
+            windows.setdefault(int(memory_time.timestamp()) // window_seconds, []).append(memory)
+
+        clusters = []
+        for window in sorted(windows):
+            members = windows[window]
+            assigned = set()
+            # 贪心：每次取当前未分配记忆最多的标签作为一簇
+            while True:
+                tag_members: Dict[str, List[Dict]] = {}
+                for memory in members:
+                    if memory["memory_id"] in assigned:
+                        continue
+                    # 没有标签的记忆之间没有可依据的共同主题，不参与聚簇
+                    for tag in memory.get("tags", []):
+                        tag_members.setdefault(tag, []).append(memory)
+                if not tag_members:
+                    break
+                tag = max(sorted(tag_members), key=lambda t: len(tag_members[t]))
+                if len(tag_members[tag]) < min_size:
+                    break
+                cluster = sorted(tag_members[tag], key=lambda m: m["timestamp"])
+                clusters.append(cluster)
+                assigned.update(m["memory_id"] for m in cluster)
+        return clusters
+
+    async def consolidate_session(self, session_id: str) -> int:
+        """整理单个会话，返回被合并掉的记忆条数"""
+        if not self.config.get("enable_memory_management", True):
+            return 0
+        
+        # 直接读数据而不走get_memories，后台整理不应算作会话被访问
+        snapshot = [dict(m) for m in self.memory_manager.memories.get(session_id, [])]
+        if not snapshot:
+            return 0
+
+        clusters = await asyncio.to_thread(self.find_clusters, snapshot)
+        merged = 0
+        for start in range(0, len(clusters), self.batch_size):
+            for cluster in clusters[start:start + self.batch_size]:
+                summary = await self.summarizer.summarize(cluster)
+                if not summary:
+                    continue
+                tags = sorted({tag for m in cluster for tag in m.get("tags", [])})
+                # 摘要生成期间不持锁；替换时与快照逐条比对，簇里的记忆被删除或改动过就放弃这一簇
+                async with self.memory_manager.session_lock(session_id):
+                    max_importance = self.config.get("consolidation_max_importance", 3)
+                    live = [self.memory_manager.get_memory_by_id(session_id, m["memory_id"]) for m in cluster]
+                    if any(memory is not None and memory["importance"] > max_importance for memory in live):
+                        replaced = False
+                    else:
+                        replaced = self.memory_manager.replace_memories(
+                            session_id,
+                            cluster,
+                            summary,
+                            max(m["importance"] for m in cluster),
+                            tags,
+                            cluster[-1]["timestamp"]
+                        )
+                if replaced:
+                    merged += len(cluster) - 1
+            await self.memory_manager.save_memories()
+            # 批次之间让出事件循环
+            await asyncio.sleep(0)
+
+        if merged:
+            logger.info(f"[Consolidator] 会话 {session_id} 整理完成，合并了 {merged} 条记忆")
+        return merged
+
+    async def run_once(self) -> int:
+        """执行一轮整理，支持从上次中断处继续"""
+        state = self._load_state()
+        pending = state.get("pending_sessions")
+        if pending:
+            logger.info(f"[Consolidator] 继续上次未完成的整理，剩余 {len(pending)} 个会话")
+        else:
+            pending = list(self.memory_manager.memories.keys())
+            state = {"started_at": datetime.datetime.now().strftime(TIME_FORMAT), "pending_sessions": pending}
+            self._save_state(state)
+
+        total = 0
+        while pending:
+            session_id = pending[0]
+            try:
+                total += await self.consolidate_session(session_id)
+            except Exception as e:
+                logger.error(f"[Consolidator] 整理会话 {session_id} 失败: {e}")
+            pending.pop(0)
+            self._save_state(state)
+
+        state["pending_sessions"] = []
+        state["finished_at"] = datetime.datetime.now().strftime(TIME_FORMAT)
+        self._save_state(state)
+        return total
+
+    async def run_forever(self):
+        """后台定时整理"""
+        # 上次有没跑完的整理时，启动后先把它跑完
+        resume = bool(self._load_state().get("pending_sessions"))
+        while True:
+            if not resume:
+                interval = self.config.get("consolidation_interval_minutes", 60)
+                await asyncio.sleep(max(interval, 1) * 60)
+            resume = False
+            if not self.config.get("consolidation_enabled", False):
+                continue
+            try:
+                merged = await self.run_once()
+                logger.info(f"[Consolidator] 定时整理完成，共合并 {merged} 条记忆")
+            except Exception as e:
+                logger.error(f"[Consolidator] 定时整理失败: {e}")
@@ -0,0 +1,204 @@
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+Span = Tuple[int, int]
+
+PINYIN_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pinyin_table.txt")
+NGRAM_SIZE = 2
+
+_pinyin_table: Optional[Dict[str, Tuple[str, ...]]] = None
+
+
+def load_pinyin_table() -> Dict[str, Tuple[str, ...]]:
+    """读取随插件附带的离线拼音表（汉字 -> 全部读音，最常用的在前），只在第一次用到时读取"""
+    global _pinyin_table
+    if _pinyin_table is None:
+        table: Dict[str, Tuple[str, ...]] = {}
+        with open(PINYIN_TABLE_FILE, "r", encoding='utf-8') as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                syllable, chars = line.split()
+                # 常用读音的行都排在多音字其他读音（+开头）之前
+                syllable = syllable.lstrip("+")
+                for char in chars:
+                    table[char] = table.get(char, ()) + (syllable,)
+        _pinyin_table = table
+    return _pinyin_table
+
+
+def char_readings(text: str) -> Tuple[List[Tuple[str, ...]], List[int]]:
+    """逐字给出可能的读音
+
+    汉字取拼音表中的全部读音，字母和数字转小写原样保留，空白和标点丢弃。
+    同时返回每个保留下来的字在原文中的下标，用来把命中位置映射回原文。
+    """
+    table = load_pinyin_table()
+    readings: List[Tuple[str, ...]] = []
+    offsets: List[int] = []
+    for i, char in enumerate(text):
+        char_pinyin = table.get(char)
+        if char_pinyin is None:
+            if not char.isalnum():
+                continue
+            char_pinyin = (char.lower(),)
+        readings.append(char_pinyin)
+        offsets.append(i)
+    return readings, offsets
+
+
+def to_pinyin(text: str) -> str:
+    """把文本转成连写的拼音串，多音字取最常用的读音"""
+    return "".join(char_pinyin[0] for char_pinyin in char_readings(text)[0])
+
+
+def max_typos(length: int) -> int:
+    """按关键词长度允许的编辑距离，太短的词容错没有意义（同音字由拼音索引处理）"""
+    if length < 3:
+        return 0
+    return 1 if length <= 5 else 2
+
+
+def substring_distance(pattern: str, text: str) -> Tuple[int, int]:
+    """pattern与text中最接近的子串之间的编辑距离，以及该子串在text中的结束位置
+
+    Sellers算法：第一行全为0，子串可以从text的任意位置开始。
+    """
+    m = len(pattern)
+    prev = list(range(m + 1))
+    best_distance, best_end = m, 0
+    for j, char in enumerate(text, 1):
+        cur = [0]
+        for i in range(1, m + 1):
+            cost = 0 if pattern[i - 1] == char else 1
+            cur.append(min(prev[i - 1] + cost, prev[i] + 1, cur[i - 1] + 1))
+        if cur[m] < best_distance:
+            best_distance, best_end = cur[m], j
+            if best_distance == 0:
+                break
+        prev = cur
+    return best_distance, best_end
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def _merge_spans(spans: List[Span]) -> List[Span]:
+    merged: List[Span] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class FuzzyIndex:
+    """单个会话的拼音和n-gram索引，精确搜索没有结果时兜底
+
+    拼音索引保存每条记忆逐字的读音（含多音字的全部读音），关键词转成拼音后必须恰好由
+    连续若干个字的读音拼成，能找到用拼音或同音字搜索的记忆；n-gram索引是字符二元组的倒排表，
+    先用共同二元组的数量筛出候选（编辑距离为k时至少有 二元组数-2k 个相同），
+    再逐条计算编辑距离，用来容忍错别字。
+    """
+
+    def __init__(self):
+        self.texts: Dict[str, str] = {}
+        self.pinyin: Dict[str, Tuple[List[Tuple[str, ...]], List[int]]] = {}
+        # 每条记忆里读音以某个字母开头的字的位置，拼音匹配只从这些位置起步
+        self.heads: Dict[str, Dict[str, List[int]]] = {}
+        self.postings: Dict[str, Set[str]] = {}
+
+    def add(self, memory_id: str, content: str):
+        """加入一条记忆"""
+        self.remove(memory_id)
+        text = content.lower()
+        self.texts[memory_id] = text
+        readings, offsets = char_readings(content)
+        self.pinyin[memory_id] = (readings, offsets)
+        heads: Dict[str, List[int]] = {}
+        for i, char_pinyin in enumerate(readings):
+            for letter in {reading[0] for reading in char_pinyin}:
+                heads.setdefault(letter, []).append(i)
+        self.heads[memory_id] = heads
+        for gram in _ngrams(text):
+            self.postings.setdefault(gram, set()).add(memory_id)
+
+    def remove(self, memory_id: str):
+        """移除一条记忆"""
+        text = self.texts.pop(memory_id, None)
+        if text is None:
+            return
+        del self.pinyin[memory_id]
+        del self.heads[memory_id]
+        for gram in _ngrams(text):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(memory_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def _pinyin_matches(self, term: str) -> Dict[str, List[Span]]:
+        query = to_pinyin(term)
+        if len(query) < 2:
+            return {}
+
+        matches = {}
+        for memory_id, heads in self.heads.items():
+            if query[0] not in heads:
+                continue
+            readings, offsets = self.pinyin[memory_id]
+            spans = []
+            for start in heads[query[0]]:
+                # 从start开始逐字往后走，记录拼音串已经对上的长度（多音字可能有多种走法）
+                matched = {0}
+                end = start
+                while matched and end < len(readings):
+                    matched = {pos + len(reading) for pos in matched for reading in readings[end]
+                               if query.startswith(reading, pos)}
+                    end += 1
+                    if len(query) in matched:
+                        spans.append((offsets[start], offsets[end - 1] + 1))
+                        break
+            if spans:
+                matches[memory_id] = spans
+        return matches
+
+    def _typo_matches(self, term: str) -> Dict[str, List[Span]]:
+        typos = max_typos(len(term))
+        grams = _ngrams(term)
+        if not typos or not grams:
+            return {}
+
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.postings.get(gram, ()))
+        min_shared = max(1, len(grams) - 2 * typos)
+
+        matches = {}
+        for memory_id, shared in counts.items():
+            if shared < min_shared:
+                continue
+            text = self.texts[memory_id]
+            distance, end = substring_distance(term, text)
+            if distance <= typos:
+                # 反过来再算一次，得到最接近的子串的起点
+                start = end - substring_distance(term[::-1], text[end - 1::-1] if end else "")[1]
+                matches[memory_id] = [(start, end)]
+        return matches
+
+    def search(self, keywords: List[str]) -> List[Tuple[str, int, List[Span]]]:
+        """模糊搜索，返回 (记忆ID, 命中的关键词数, 命中位置) 列表，顺序不保证"""
+        scores: Dict[str, int] = {}
+        spans: Dict[str, List[Span]] = {}
+        for term in keywords:
+            term = term.lower()
+            hits = self._pinyin_matches(term)
+            for memory_id, term_spans in self._typo_matches(term).items():
+                hits.setdefault(memory_id, []).extend(term_spans)
+            for memory_id, term_spans in hits.items():
+                scores[memory_id] = scores.get(memory_id, 0) + 1
+                spans.setdefault(memory_id, []).extend(term_spans)
+        return [(memory_id, score, _merge_spans(spans[memory_id])) for memory_id, score in scores.items()]
@@ -3,10 +3,17 @@ from astrbot.api.star import Context, Star, register
 from astrbot.api.event.filter import command, command_group
 from astrbot.api import llm_tool
 import os
+import asyncio
+import datetime
 import logging
 
-from .memory_manager import MemoryManager
+from .memory_manager import MemoryManager, INSERT_MERGED, INSERT_ARCHIVED
 from .config_manager import ConfigManager
+from .consolidator import MemoryConsolidator, ExtractiveSummarizer, LLMSummarizer
+from .time_index import parse_time_spec
+from .memory_io import export_ndjson, import_ndjson
+from .snippet import render_snippet
+from .response_cache import ResponseCache
 
 logger = logging.getLogger("astrbot")
 
@@ -21,6 +28,7 @@ class Main(Star):
         # 确保目录存在
         os.makedirs(os.path.join(data_dir, "memories"), exist_ok=True)
         self.data_file = os.path.join(data_dir, "memories", "memory_data.json")
+        self.export_dir = os.path.join(data_dir, "memories", "exports")
         
         # 初始化配置管理器
         default_config = {
@@ -28,36 +36,123 @@ class Main(Star):
             "auto_save_enabled": config.get("auto_save_enabled", True),
             "importance_threshold": config.get("importance_threshold", 3),
             "memory_expire_days": config.get("memory_expire_days", 30),
-            "enable_memory_management": config.get("enable_memory_management", True)
+            "enable_memory_management": config.get("enable_memory_management", True),
+            "dedup_enabled": config.get("dedup_enabled", True),
+            "dedup_threshold": config.get("dedup_threshold", 0.85),
+            "dedup_dry_run": config.get("dedup_dry_run", False),
+            "consolidation_enabled": config.get("consolidation_enabled", False),
+            "consolidation_interval_minutes": config.get("consolidation_interval_minutes", 60),
+            "consolidation_max_importance": config.get("consolidation_max_importance", 3),
+            "consolidation_window_hours": config.get("consolidation_window_hours", 24),
+            "consolidation_min_cluster_size": config.get("consolidation_min_cluster_size", 3),
+            "consolidation_use_llm": config.get("consolidation_use_llm", False),
+            "multi_process_mode": config.get("multi_process_mode", False),
+            "global_max_memories": config.get("global_max_memories", 0),
+            "global_max_mb": config.get("global_max_mb", 0),
+            "snippet_width": config.get("snippet_width", 30),
+            "fuzzy_search_enabled": config.get("fuzzy_search_enabled", True),
+            "archive_enabled": config.get("archive_enabled", True),
+            "tool_cache_size": config.get("tool_cache_size", 256)
         }
         self.config_manager = ConfigManager(default_config)
         
         # 初始化记忆管理器
         self.memory_manager = MemoryManager(self.data_file, self.config_manager.get_config())
         
+        # LLM工具输出的缓存，会话有修改时自动失效
+        self.response_cache = ResponseCache(self.memory_manager.config.get("tool_cache_size", 256))
+        
+        # 初始化记忆整理器，后台定时运行
+        self.consolidator = MemoryConsolidator(
+            self.memory_manager,
+            self._create_summarizer(),
+            os.path.join(data_dir, "memories", "consolidation_state.json")
+        )
+        self._consolidation_task = asyncio.create_task(self.consolidator.run_forever())
+        
         logger.info("AI记忆管理插件初始化完成")
 
+    def _create_summarizer(self):
+        """根据配置创建记忆整理用的摘要器"""
+        if self.memory_manager.config.get("consolidation_use_llm", False):
+            return LLMSummarizer(self.context)
+        return ExtractiveSummarizer()
+
     def _get_session_id(self, event: AstrMessageEvent) -> str:
         """获取统一的会话ID"""
         if hasattr(event, 'unified_msg_origin'):
             return event.unified_msg_origin
         return str(event.session_id)
 
+    def _get_command_text(self, event: AstrMessageEvent, subcommand: str, fallback: str) -> str:
+        """取子指令之后的完整文本
+        
+        指令参数按空格切分，含空格的参数（如标签表达式）只能拿到第一段，这里从原始消息中取回。
+        """
+        tokens = event.message_str.split()
+        if subcommand in tokens:
+            text = " ".join(tokens[tokens.index(subcommand) + 1:])
+            if text:
+                return text
+        return fallback
+
+    def _cached_response(self, session_id: str, tool: str, args: tuple, render) -> str:
+        """按会话版本号缓存工具输出，会话没有变化时直接返回上次生成的文本"""
+        key = (session_id, tool, args)
+        version = self.memory_manager.get_session_version(session_id)
+        cached = self.response_cache.get(key, version)
+        if cached is not None:
+            logger.debug(f"[{tool}] 命中缓存 - 会话: {session_id}, 版本: {version}")
+            return cached
+        
+        text = render()
+        self.response_cache.put(key, version, text)
+        return text
+
+    def _format_tag_results(self, memories: list, expression: str) -> str:
+        """格式化标签查询结果"""
+        memory_text = f"🏷️ 标签查询 '{expression}' 找到 {len(memories)} 条记忆：\n"
+        for i, memory in enumerate(memories):
+            importance_stars = "⭐" * memory["importance"]
+            memory_text += f"{i+1}. {memory['content']}\n"
+            memory_text += f"   {importance_stars} | {memory['timestamp']} | {', '.join(memory.get('tags', []))}\n"
+        return memory_text
+
     @command_group("memory")
     def memory(self):
         """记忆管理指令组"""
         pass
 
     @memory.command("list")
-    async def list_memories(self, event: AstrMessageEvent):
-        """列出所有记忆"""
+    async def list_memories(self, event: AstrMessageEvent, option: str = "", value: str = ""):
+        """列出所有记忆，支持 --since 7d 只列出最近的记忆"""
         session_id = self._get_session_id(event)
-        memories = self.memory_manager.get_memories_sorted(session_id)
         
-        if not memories:
-            return event.plain_result("当前会话没有保存的记忆。")
+        # 支持 "--since 7d"、"--since=7d" 和直接写 "7d"
+        since = ""
+        if option == "--since":
+            since = value
+        elif option.startswith("--since="):
+            since = option[len("--since="):]
+        elif option:
+            since = option
+        
+        if since:
+            try:
+                start = parse_time_spec(since)
+            except ValueError as e:
+                return event.plain_result(f"❌ {e}")
+            memories = self.memory_manager.get_memories_between(session_id, start)
+            memories = sorted(memories, key=lambda x: x["importance"], reverse=True)
+            if not memories:
+                return event.plain_result(f"{start.strftime('%Y-%m-%d %H:%M:%S')} 之后没有保存的记忆。")
+            memory_text = f"📝 {start.strftime('%Y-%m-%d %H:%M:%S')} 之后的记忆:\n"
+        else:
+            memories = self.memory_manager.get_memories_sorted(session_id)
+            if not memories:
+                return event.plain_result("当前会话没有保存的记忆。")
+            memory_text = "📝 已保存的记忆:\n"
         
-        memory_text = "📝 已保存的记忆:\n"
         for i, memory in enumerate(memories):
             importance_stars = "⭐" * memory["importance"]
             memory_text += f"{i+1}. {memory['content']}\n"
@@ -68,14 +163,26 @@ class Main(Star):
 
     @memory.command("search")
     async def search_memories(self, event: AstrMessageEvent, keyword: str):
-        """搜索记忆"""
+        """搜索记忆，加 --archive 时搜索已归档的旧记忆"""
         session_id = self._get_session_id(event)
+        keyword = self._get_command_text(event, "search", keyword)
+        if keyword.split()[:1] == ["--archive"]:
+            keyword = keyword[len("--archive"):].strip()
+            if not keyword:
+                return event.plain_result("❌ 请提供要在归档中搜索的关键词。")
+            memories = await self.memory_manager.search_archive(session_id, keyword)
+            if not memories:
+                return event.plain_result(f"归档中没有找到包含 '{keyword}' 的记忆。")
+            return event.plain_result(self._format_archive_results(memories, keyword, None))
+        
         memories = self.memory_manager.search_memories(session_id, keyword)
         
         if not memories:
             return event.plain_result(f"没有找到包含 '{keyword}' 的记忆。")
         
         memory_text = f"🔍 搜索结果 (关键词: {keyword}):\n"
+        if memories[0].get("fuzzy_match"):
+            memory_text += "（没有精确匹配，以下为拼音/近似匹配结果）\n"
         for i, memory in enumerate(memories):
             importance_stars = "⭐" * memory["importance"]
             memory_text += f"{i+1}. {memory['content']}\n"
@@ -84,27 +191,94 @@ class Main(Star):
         
         return event.plain_result(memory_text)
 
+    def _format_archive_results(self, memories: list, keyword: str, width, limit: int = 20) -> str:
+        """格式化归档搜索结果，width为None时显示全文"""
+        memory_text = f"🗄️ 在归档中搜索 '{keyword}' 找到 {len(memories)} 条已删除的旧记忆：\n"
+        for i, memory in enumerate(memories[:limit]):
+            importance_stars = "⭐" * memory["importance"]
+            content = render_snippet(memory["content"], memory.get("match_spans", []), width)
+            memory_text += f"{i+1}. {content}\n"
+            memory_text += f"   {importance_stars} | {memory['timestamp']} | 归档于 {memory.get('archived_at', '未知')} ({memory.get('archive_reason', '')})\n"
+        if len(memories) > limit:
+            memory_text += f"... 还有 {len(memories) - limit} 条，请使用更具体的关键词\n"
+        return memory_text
+
+    @memory.command("tag")
+    async def query_tags(self, event: AstrMessageEvent, expression: str):
+        """按标签表达式查询记忆"""
+        session_id = self._get_session_id(event)
+        expression = self._get_command_text(event, "tag", expression)
+        
+        try:
+            memories = self.memory_manager.query_tags(session_id, expression)
+        except ValueError as e:
+            return event.plain_result(f"❌ 标签表达式有误: {e}")
+        
+        if not memories:
+            return event.plain_result(f"没有找到符合 '{expression}' 的记忆。")
+        return event.plain_result(self._format_tag_results(memories, expression))
+
+    @memory.command("tags")
+    async def list_tags(self, event: AstrMessageEvent):
+        """列出当前会话的所有标签"""
+        session_id = self._get_session_id(event)
+        tag_counts = self.memory_manager.get_tag_counts(session_id)
+        
+        if not tag_counts:
+            return event.plain_result("当前会话没有任何标签。")
+        
+        tags_text = f"🏷️ 共有 {len(tag_counts)} 个标签:\n"
+        for tag in sorted(tag_counts):
+            tags_text += f"  {tag}: {tag_counts[tag]}条\n"
+        return event.plain_result(tags_text)
+
     @memory.command("stats")
     async def memory_stats(self, event: AstrMessageEvent):
         """显示记忆统计信息"""
         session_id = self._get_session_id(event)
         stats = self.memory_manager.get_memory_stats(session_id)
         
+        stats_text = "📊 记忆统计信息:\n"
         if stats["total"] == 0:
-            return event.plain_result("当前会话没有保存的记忆。")
+            # 当前会话为空时全局用量、归档等信息仍然有用，照常显示
+            stats_text += "当前会话没有保存的记忆。\n"
+        else:
+            stats_text += f"总记忆数: {stats['total']}\n"
+            stats_text += f"平均重要性: {stats['avg_importance']}/5\n"
+            stats_text += "重要性分布:\n"
+            
+            for importance, count in stats["importance_distribution"].items():
+                if count > 0:
+                    stars = "⭐" * importance
+                    stats_text += f"  {stars} ({importance}级): {count}条\n"
         
-        stats_text = "📊 记忆统计信息:\n"
-        stats_text += f"总记忆数: {stats['total']}\n"
-        stats_text += f"平均重要性: {stats['avg_importance']}/5\n"
-        stats_text += "重要性分布:\n"
+        archive = await self.memory_manager.get_archive_stats(session_id)
+        if archive["records"]:
+            stats_text += f"已归档: {archive['records']}条 (压缩后 {archive['bytes'] / 1024:.1f}KB，可用 /memory search --archive 搜索)\n"
         
-        for importance, count in stats["importance_distribution"].items():
-            if count > 0:
-                stars = "⭐" * importance
-                stats_text += f"  {stars} ({importance}级): {count}条\n"
+        stats_text += self._format_global_usage()
         
+        cache = self.response_cache.stats()
+        stats_text += f"\n工具响应缓存: 命中率 {cache['hit_rate']:.1%} ({cache['hits']}/{cache['hits'] + cache['misses']})，"
+        stats_text += f"缓存 {cache['size']}/{cache['max_size']} 条\n"
         return event.plain_result(stats_text)
 
+    def _format_global_usage(self) -> str:
+        """格式化全局用量及与预算的距离"""
+        usage = self.memory_manager.get_global_stats()
+        usage_text = f"\n全局用量 ({usage['sessions']}个会话):\n"
+        
+        records_text = f"  记忆条数: {usage['records']}"
+        if usage["max_records"]:
+            records_text += f"/{usage['max_records']} ({usage['record_usage']:.1%})"
+        usage_text += records_text + "\n"
+        
+        bytes_text = f"  占用空间: {usage['bytes'] / 1024 / 1024:.2f}MB"
+        if usage["max_bytes"]:
+            bytes_text += f"/{usage['max_bytes'] / 1024 / 1024:.0f}MB ({usage['byte_usage']:.1%})"
+        usage_text += bytes_text + "\n"
+        return usage_text
+
     @memory.command("add")
     async def add_memory(self, event: AstrMessageEvent, content: str, importance: int = 3, tags: str = None):
         """手动添加一条记忆，支持自定义标签"""
@@ -121,13 +295,19 @@ class Main(Star):
         if tags:
             custom_tags = [tag.strip() for tag in tags.split(',')]
         
-        if self.memory_manager.add_memory(session_id, content.strip(), importance, custom_tags):
+        async with self.memory_manager.session_lock(session_id):
+            outcome, merged_from = self.memory_manager.add_memory(session_id, content.strip(), importance, custom_tags)
+            if outcome is None:
+                return event.plain_result("❌ 记忆管理功能已禁用，无法添加记忆。")
             await self.memory_manager.save_memories()
-            importance_stars = "⭐" * importance
-            tag_info = f"\n标签: {', '.join(custom_tags)}" if custom_tags else ""
-            return event.plain_result(f"✅ 已添加记忆: {content}\n重要程度: {importance_stars} ({importance}/5){tag_info}")
-        else:
-            return event.plain_result("❌ 记忆管理功能已禁用，无法添加记忆。")
+        
+        importance_stars = "⭐" * importance
+        tag_info = f"\n标签: {', '.join(custom_tags)}" if custom_tags else ""
+        if outcome == INSERT_ARCHIVED:
+            return event.plain_result(f"⚠️ 已保存，但全局记忆容量已满，这条记忆随即被移入归档: {content}\n可使用 /memory search --archive 查看")
+        if outcome == INSERT_MERGED:
+            return event.plain_result(f"✅ 已合并到已有记忆: {merged_from}\n更新为: {content}\n重要程度: {importance_stars} ({importance}/5){tag_info}")
+        return event.plain_result(f"✅ 已添加记忆: {content}\n重要程度: {importance_stars} ({importance}/5){tag_info}")
 
     @memory.command("edit")
     async def edit_memory(self, event: AstrMessageEvent, index: int, content: str):
@@ -138,13 +318,12 @@ class Main(Star):
         if not content.strip():
             return event.plain_result("❌ 记忆内容不能为空。")
         
-        memories = self.memory_manager.get_memories(session_id)
-        if index < 0 or index >= len(memories):
-            return event.plain_result("❌ 无效的记忆序号。")
-        
-        old_content = memories[index]["content"]
-        memories[index]["content"] = content.strip()
-        await self.memory_manager.save_memories()
+        async with self.memory_manager.session_lock(session_id):
+            old_content = self.memory_manager.edit_memory(session_id, index, content.strip())
+            if old_content is None:
+                return event.plain_result("❌ 无效的记忆序号。")
+            
+            await self.memory_manager.save_memories()
         
         return event.plain_result(f"✅ 已编辑记忆:\n原内容: {old_content}\n新内容: {content}")
 
@@ -152,9 +331,10 @@ class Main(Star):
     async def clear_memories(self, event: AstrMessageEvent):
         """清空当前会话的所有记忆"""
         session_id = self._get_session_id(event)
-        if self.memory_manager.clear_memories(session_id):
-            await self.memory_manager.save_memories()
-            return event.plain_result("✅ 已清空所有记忆。")
+        async with self.memory_manager.session_lock(session_id):
+            if self.memory_manager.clear_memories(session_id):
+                await self.memory_manager.save_memories()
+                return event.plain_result("✅ 已清空所有记忆。")
         return event.plain_result("当前会话没有保存的记忆。")
 
     @memory.command("remove")
@@ -163,10 +343,11 @@ class Main(Star):
         session_id = self._get_session_id(event)
         index = index - 1  # 用户输入1-based，转换为0-based
         
-        removed = self.memory_manager.remove_memory(session_id, index)
-        if removed:
-            await self.memory_manager.save_memories()
-            return event.plain_result(f"✅ 已删除记忆: {removed['content']}")
+        async with self.memory_manager.session_lock(session_id):
+            removed = self.memory_manager.remove_memory(session_id, index)
+            if removed:
+                await self.memory_manager.save_memories()
+                return event.plain_result(f"✅ 已删除记忆: {removed['content']}")
         return event.plain_result("❌ 无效的记忆序号。")
 
     @memory.command("update")
@@ -178,11 +359,93 @@ class Main(Star):
         if importance < 1 or importance > 5:
             return event.plain_result("❌ 重要性必须在1-5之间。")
         
-        if self.memory_manager.update_memory_importance(session_id, index, importance):
-            await self.memory_manager.save_memories()
-            return event.plain_result(f"✅ 已更新记忆重要性为 {importance}。")
+        async with self.memory_manager.session_lock(session_id):
+            if self.memory_manager.update_memory_importance(session_id, index, importance):
+                await self.memory_manager.save_memories()
+                return event.plain_result(f"✅ 已更新记忆重要性为 {importance}。")
         return event.plain_result("❌ 无效的记忆序号。")
 
+    @memory.command("dedup")
+    async def dedup_report(self, event: AstrMessageEvent):
+        """显示近似重复记忆报告"""
+        session_id = self._get_session_id(event)
+        groups = self.memory_manager.find_duplicate_groups(session_id)
+        dry_run_hits = self.memory_manager.get_dedup_report(session_id)
+        
+        if not groups and not dry_run_hits:
+            return event.plain_result("没有发现近似重复的记忆。")
+        
+        report_text = "🧹 近似重复报告:\n"
+        if groups:
+            report_text += f"\n已保存的记忆中有 {len(groups)} 组近似重复:\n"
+            for i, group in enumerate(groups):
+                report_text += f"{i+1}.\n"
+                for memory in group:
+                    report_text += f"   - {memory['content']} ({memory['importance']}/5, {memory['timestamp']})\n"
+        
+        if dry_run_hits:
+            report_text += f"\n演练模式下最近 {len(dry_run_hits)} 次命中:\n"
+            for hit in dry_run_hits:
+                report_text += f"• [{hit['timestamp']}] {hit['content']}\n"
+                report_text += f"   ≈ {hit['duplicate_of']} (相似度: {hit['similarity']})\n"
+        
+        return event.plain_result(report_text)
+
+    @memory.command("consolidate")
+    async def consolidate_memories(self, event: AstrMessageEvent):
+        """立即整理当前会话的低重要性记忆"""
+        session_id = self._get_session_id(event)
+        merged = await self.consolidator.consolidate_session(session_id)
+        if not merged:
+            return event.plain_result("没有需要整理的低重要性记忆。")
+        return event.plain_result(f"✅ 已整理记忆，合并了 {merged} 条低重要性记忆。")
+
+    @memory.command("export")
+    async def export_memories(self, event: AstrMessageEvent):
+        """把当前会话的记忆导出为NDJSON文件"""
+        session_id = self._get_session_id(event)
+        
+        os.makedirs(self.export_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        
+        def write():
+            # 同一秒内可能有多个会话在导出，用独占模式创建文件，重名时加序号
+            suffix = 0
+            while True:
+                file_name = f"memories_{stamp}_{suffix}.ndjson" if suffix else f"memories_{stamp}.ndjson"
+                path = os.path.join(self.export_dir, file_name)
+                try:
+                    f = open(path, "x", encoding='utf-8')
+                except FileExistsError:
+                    suffix += 1
+                    continue
+                with f:
+                    return file_name, path, export_ndjson([(session_id, memories)], f)
+        
+        async with self.memory_manager.session_lock(session_id):
+            memories = self.memory_manager.get_memories(session_id)
+            if not memories:
+                return event.plain_result("当前会话没有保存的记忆。")
+            file_name, path, count = await asyncio.to_thread(write)
+        
+        return event.plain_result(f"✅ 已导出 {count} 条记忆到 {path}\n可使用 /memory import {file_name} 导入")
+
+    @memory.command("import")
+    async def import_memories(self, event: AstrMessageEvent, file_name: str):
+        """从NDJSON文件导入记忆到当前会话"""
+        session_id = self._get_session_id(event)
+        
+        # 只允许读取导出目录下的文件
+        path = os.path.join(self.export_dir, os.path.basename(file_name))
+        if not os.path.isfile(path):
+            return event.plain_result(f"❌ 找不到文件: {path}")
+        
+        with open(path, "r", encoding='utf-8') as f:
+            imported, skipped = await import_ndjson(self.memory_manager, f, session_id)
+        
+        skipped_info = f"，跳过 {skipped} 行无效数据" if skipped else ""
+        return event.plain_result(f"✅ 已导入 {imported} 条记忆{skipped_info}")
+
     @command("memory_config")
     async def show_config(self, event: AstrMessageEvent):
         """显示当前配置"""
@@ -195,6 +458,8 @@ class Main(Star):
         self.config_manager.reset_to_default()
         # 更新记忆管理器的配置
         self.memory_manager.config = self.config_manager.get_config()
+        self.consolidator.summarizer = self._create_summarizer()
+        self.response_cache.resize(self.memory_manager.config.get("tool_cache_size", 256))
         return event.plain_result("✅ 配置已重置为默认值")
 
     @command("mem_help")
@@ -206,8 +471,20 @@ class Main(Star):
 
 🔍 查看记忆：
    /memory list - 列出所有已保存的记忆
-   /memory search <关键词> - 搜索包含关键词的记忆
+   /memory list --since <时间> - 只列出最近的记忆
+   示例: /memory list --since 7d
+   /memory search <关键词> - 搜索包含关键词的记忆（找不到时按拼音/近似字再查）
+   示例: /memory search lingfeng
+   /memory search --archive <关键词> - 在已归档（淘汰/过期）的旧记忆中搜索
+   /memory tag <标签表达式> - 按标签组合查询记忆
+   示例: /memory tag 事件:* AND 人物:凌风 NOT 情感:恐惧
+   /memory tags - 列出所有标签及记忆数
+
+📦 导入/导出：
+   /memory export - 把当前会话的记忆导出为NDJSON文件
+   /memory import <文件名> - 从导出目录中的NDJSON文件导入记忆
    /memory stats - 显示记忆统计信息
+   /memory dedup - 显示近似重复记忆报告
 
 ✏️ 添加/编辑记忆：
    /memory add <内容> [重要性] - 手动添加记忆(重要性默认3，范围1-5)
@@ -222,6 +499,8 @@ class Main(Star):
    示例: /memory remove 1
    
    /memory clear - 清空当前会话的所有记忆
+   
+   /memory consolidate - 立即把零散的低重要性记忆整理成摘要
 
 ⚙️ 调整记忆：
    /memory update <序号> <重要性> - 更新记忆的重要性(1-5)
@@ -236,12 +515,14 @@ class Main(Star):
 
 ⚙️ 记忆特性：
    - 每个会话最多保存记忆数量可在管理面板配置
+   - 可设置全部会话合计的容量预算，超出时优先淘汰最久未使用的会话中不重要的记忆
    - 记忆按重要程度(1-5)排序，⭐表示重要性
-   - 记忆数量超限时会自动删除最不重要的记忆
+   - 记忆数量超限时会自动删除最不重要的记忆，删除和过期的记忆会移入压缩归档，仍可搜索
    - AI会自动保存它认为重要的信息
    - AI在对话时会参考历史记忆
    - 支持记忆过期自动清理
    - 支持记忆重要性手动调整
+   - 保存时自动检测近似重复的记忆并合并
 
 💡 使用建议：
    - 使用 /memory add 手动添加重要信息
@@ -278,12 +559,20 @@ class Main(Star):
         if tags:
             custom_tags = [tag.strip() for tag in tags.split(',')]
         
-        if self.memory_manager.add_memory(session_id, content, importance, custom_tags):
-            await self.memory_manager.save_memories()
+        async with self.memory_manager.session_lock(session_id):
+            outcome, merged_from = self.memory_manager.add_memory(session_id, content, importance, custom_tags)
+            if outcome is not None:
+                await self.memory_manager.save_memories()
+        
+        if outcome is not None:
             tag_info = f" 标签: {', '.join(custom_tags)}" if custom_tags else ""
             logger.info(f"[save_memory] 保存记忆成功 - 会话: {session_id}, 重要性: {importance}, 内容: {content[:50]}...")
             if custom_tags:
                 logger.debug(f"[save_memory] 标签: {', '.join(custom_tags)}")
+            if outcome == INSERT_ARCHIVED:
+                return f"⚠️ 已保存，但全局记忆容量已满，这条记忆随即被移入归档（可用 deep_search 找回）: {content}"
+            if outcome == INSERT_MERGED:
+                return f"✅ 已合并到已有记忆: {merged_from}，已更新为: {content} (重要性: {importance}/5){tag_info}"
             return f"✅ 我记住了: {content} (重要性: {importance}/5){tag_info}"
         else:
             logger.warning(f"[save_memory] 记忆保存失败 - 记忆管理功能已禁用")
@@ -297,6 +586,11 @@ class Main(Star):
             limit(number): 返回记忆的数量限制，0表示返回所有记忆
         """
         session_id = self._get_session_id(event)
+        return self._cached_response(session_id, "get_memories", (limit,),
+                                     lambda: self._render_memories(session_id, limit))
+
+    def _render_memories(self, session_id: str, limit: int) -> str:
+        """生成 get_memories 工具的输出"""
         memories = self.memory_manager.get_memories_sorted(session_id)
         
         # 记录日志
@@ -367,47 +661,39 @@ class Main(Star):
         
         # 记录搜索请求
         logger.info(f"[search_memories] 会话ID: {session_id}, 搜索关键词: '{keyword}', show_all: {show_all}")
+        return self._cached_response(session_id, "search_memories", (keyword, show_all),
+                                     lambda: self._render_search(session_id, keyword, show_all))
+
+    def _render_search(self, session_id: str, keyword: str, show_all: bool) -> str:
+        """生成 search_memories 工具的输出"""
+        # 空关键词时 search_memories 返回全部记忆，工具只应返回命中结果
+        if not keyword.strip():
+            return f"没有找到包含 '{keyword}' 的记忆。"
         
-        # 支持多关键词搜索
-        keywords = keyword.split()
-        all_matches = []
-        
-        for kw in keywords:
-            matches = self.memory_manager.search_memories(session_id, kw)
-            logger.debug(f"[search_memories] 关键词 '{kw}' 匹配到 {len(matches)} 条记忆")
-            for match in matches:
-                # 避免重复添加
-                if not any(m['memory_id'] == match.get('memory_id', match['content']) for m in all_matches):
-                    all_matches.append(match)
-        
+        # 一次查询完成多关键词匹配，结果附带命中位置
+        all_matches = self.memory_manager.search_memories(session_id, keyword)
         logger.info(f"[search_memories] 总共找到 {len(all_matches)} 条匹配的记忆")
         
         if not all_matches:
             logger.info(f"[search_memories] 没有找到包含 '{keyword}' 的记忆")
             return f"没有找到包含 '{keyword}' 的记忆。"
         
-        # 按重要性排序
-        all_matches.sort(key=lambda x: x["importance"], reverse=True)
+        # 按重要性排序（同等重要性下保持匹配度顺序）；排序副本，不改动会话里的记忆顺序
+        all_matches = sorted(all_matches, key=lambda x: x["importance"], reverse=True)
+        width = self.memory_manager.config.get("snippet_width", 30)
         
-        memory_text = f"🔍 搜索 '{keyword}' 找到 {len(all_matches)} 条相关记忆：\n\n"
+        if all_matches[0].get("fuzzy_match"):
+            memory_text = f"🔍 没有精确包含 '{keyword}' 的记忆，按拼音/近似字找到 {len(all_matches)} 条可能相关的记忆：\n\n"
+        else:
+            memory_text = f"🔍 搜索 '{keyword}' 找到 {len(all_matches)} 条相关记忆：\n\n"
         
         if show_all or len(all_matches) <= 10:
             # 显示所有结果
             for i, memory in enumerate(all_matches):
                 importance_stars = "⭐" * memory["importance"]
-                # 高亮匹配的关键词
-                content = memory['content']
-                for kw in keywords:
-                    if kw.lower() in content.lower():
-                        # 简单的高亮标记
-                        content = content.replace(kw, f"【{kw}】")
-                        content = content.replace(kw.lower(), f"【{kw.lower()}】")
-                        content = content.replace(kw.upper(), f"【{kw.upper()}】")
-                
-                # 5星记忆完整显示，其他记忆可以截断
-                if memory["importance"] < 5 and len(content) > 150:
-                    content = content[:150] + "..."
-                
+                # 5星记忆完整显示，其他记忆只截取命中位置附近的片段
+                content = render_snippet(memory['content'], memory.get('match_spans', []),
+                                         None if memory["importance"] == 5 else width)
                 memory_text += f"{i+1}. {content}\n"
                 memory_text += f"   {importance_stars} | {memory['timestamp']}\n\n"
         else:
@@ -429,7 +715,7 @@ class Main(Star):
             if four_star:
                 memory_text += f"【中度相关 ⭐⭐⭐⭐】({len(four_star)}条)：\n"
                 for memory in four_star[:5]:
-                    content = memory['content'][:80] + "..." if len(memory['content']) > 80 else memory['content']
+                    content = render_snippet(memory['content'], memory.get('match_spans', []), width)
                     memory_text += f"• {content}\n"
                 if len(four_star) > 5:
                     memory_text += f"... 还有 {len(four_star) - 5} 条中度相关记忆\n"
@@ -444,10 +730,50 @@ class Main(Star):
         
         return memory_text
 
+    @llm_tool(name="deep_search")
+    async def deep_search_tool(self, event: AstrMessageEvent, keyword: str) -> str:
+        """在已归档的旧记忆中搜索。因数量超限、过期或清理而删除的记忆会移入归档，
+        只有在 search_memories 找不到、且确实需要更久远的信息时才使用
+        
+        Args:
+            keyword(string): 搜索关键词，支持多个关键词用空格分隔
+        """
+        session_id = self._get_session_id(event)
+        logger.info(f"[deep_search] 会话ID: {session_id}, 搜索关键词: '{keyword}'")
+        
+        memories = await self.memory_manager.search_archive(session_id, keyword)
+        if not memories:
+            return f"归档中也没有找到包含 '{keyword}' 的记忆。"
+        return self._format_archive_results(memories, keyword, self.memory_manager.config.get("snippet_width", 30))
+
+    @llm_tool(name="search_memories_by_tag")
+    async def search_memories_by_tag_tool(self, event: AstrMessageEvent, query: str) -> str:
+        """按标签组合查询记忆
+        
+        Args:
+            query(string): 标签表达式，用 AND / OR / NOT 组合标签，支持括号，以*结尾表示前缀匹配，如"事件:* AND 人物:凌风 NOT 情感:恐惧"
+        """
+        session_id = self._get_session_id(event)
+        logger.info(f"[search_memories_by_tag] 会话ID: {session_id}, 表达式: '{query}'")
+        
+        try:
+            memories = self.memory_manager.query_tags(session_id, query)
+        except ValueError as e:
+            return f"标签表达式有误: {e}"
+        
+        if not memories:
+            return f"没有找到符合 '{query}' 的记忆。"
+        return self._format_tag_results(memories, query)
+
     @llm_tool(name="get_memory_stats")
     async def get_memory_stats_tool(self, event: AstrMessageEvent) -> str:
         """获取记忆统计信息"""
         session_id = self._get_session_id(event)
+        return self._cached_response(session_id, "get_memory_stats", (),
+                                     lambda: self._render_memory_stats(session_id))
+
+    def _render_memory_stats(self, session_id: str) -> str:
+        """生成 get_memory_stats 工具的输出"""
         stats = self.memory_manager.get_memory_stats(session_id)
         
         if stats["total"] == 0:
@@ -467,6 +793,36 @@ class Main(Star):
         
         return stats_text
 
+    @llm_tool(name="get_memories_between")
+    async def get_memories_between(self, event: AstrMessageEvent, start: str, end: str = "") -> str:
+        """获取某个时间段内保存的记忆，适合回答"上周发生了什么"这类问题
+        
+        Args:
+            start(string): 开始时间，可以是相对时间如"7d"(7天前)、"24h"、"30m"、"2w"，或日期"2025-10-01"、时间"2025-10-01 08:00:00"
+            end(string): 结束时间，格式同上，留空表示到现在
+        """
+        session_id = self._get_session_id(event)
+        
+        try:
+            start_time = parse_time_spec(start)
+            end_time = parse_time_spec(end, is_end=True) if end else None
+        except ValueError as e:
+            return str(e)
+        
+        memories = self.memory_manager.get_memories_between(session_id, start_time, end_time)
+        end_text = end_time.strftime("%Y-%m-%d %H:%M:%S") if end_time else "现在"
+        period = f"{start_time.strftime('%Y-%m-%d %H:%M:%S')} 至 {end_text}"
+        logger.info(f"[get_memories_between] 会话ID: {session_id}, 时间段: {period}, 找到 {len(memories)} 条记忆")
+        
+        if not memories:
+            return f"{period} 之间没有记忆。"
+        
+        memory_text = f"🕒 {period} 共有 {len(memories)} 条记忆：\n"
+        for i, memory in enumerate(memories):
+            importance_stars = "⭐" * memory["importance"]
+            memory_text += f"{i+1}. [{memory['timestamp']}] {memory['content']} ({importance_stars})\n"
+        return memory_text
+
     @llm_tool(name="clear_old_memories")
     async def clear_old_memories(self, event: AstrMessageEvent, days: int = 30) -> str:
         """清理指定天数之前的记忆
@@ -484,24 +840,14 @@ class Main(Star):
         current_time = datetime.datetime.now()
         cutoff_time = current_time - datetime.timedelta(days=days)
         
-        old_memories = []
-        for memory in memories:
-            try:
-                memory_time = datetime.datetime.strptime(memory["timestamp"], "%Y-%m-%d %H:%M:%S")
-                if memory_time < cutoff_time:
-                    old_memories.append(memory)
-            except:
-                continue
-        
-        if not old_memories:
-            return f"没有找到 {days} 天之前的记忆。"
-        
-        # 从记忆中移除旧的记忆
-        memories = [m for m in memories if m not in old_memories]
-        self.memory_manager.memories[session_id] = memories
-        await self.memory_manager.save_memories()
+        async with self.memory_manager.session_lock(session_id):
+            removed_count = self.memory_manager.remove_memories_before(session_id, cutoff_time)
+            if not removed_count:
+                return f"没有找到 {days} 天之前的记忆。"
+            
+            await self.memory_manager.save_memories()
         
-        return f"✅ 已清理 {len(old_memories)} 条 {days} 天之前的记忆。"
+        return f"✅ 已清理 {removed_count} 条 {days} 天之前的记忆。"
 
     async def on_config_update(self, new_config: dict):
         """配置更新时的回调"""
@@ -510,10 +856,14 @@ class Main(Star):
         
         # 更新记忆管理器的配置
         self.memory_manager.config = updated_config
+        self.consolidator.summarizer = self._create_summarizer()
+        # 输出格式和搜索行为可能随配置变化，缓存的结果全部作废
+        self.response_cache.resize(updated_config.get("tool_cache_size", 256))
         
         logger.info(f"记忆插件配置已更新: {updated_config}")
 
     async def terminate(self):
         """插件卸载时的清理工作"""
+        self._consolidation_task.cancel()
         await self.memory_manager.save_memories()
         logger.info("AI记忆管理插件已卸载")
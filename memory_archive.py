@@ -0,0 +1,165 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+import urllib.parse
+from typing import Dict, List, Set, Tuple
+
+from .snippet import find_spans
+
+BLOOM_HASHES = 5
+BLOOM_BITS_PER_GRAM = 10
+
+
+def _content_grams(text: str) -> Set[str]:
+    """内容的单字和二元组（单字用于单字关键词的过滤）"""
+    text = text.lower()
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _keyword_grams(keyword: str) -> Set[str]:
+    if len(keyword) == 1:
+        return {keyword}
+    return {keyword[i:i + 2] for i in range(len(keyword) - 1)}
+
+
+def _bloom_positions(gram: str, size: int) -> List[int]:
+    # 双重哈希：一次blake2b得到两个32位哈希，组合出BLOOM_HASHES个位置
+    h = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+    h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+    return [(h1 + i * h2) % size for i in range(BLOOM_HASHES)]
+
+
+def build_bloom(grams: Set[str]) -> Tuple[int, bytes]:
+    """为一组n-gram构建布隆过滤器，返回 (位数, 位图)"""
+    size = max(64, (len(grams) * BLOOM_BITS_PER_GRAM + 7) // 8 * 8)
+    bits = bytearray(size // 8)
+    for gram in grams:
+        for pos in _bloom_positions(gram, size):
+            bits[pos >> 3] |= 1 << (pos & 7)
+    return size, bytes(bits)
+
+
+def bloom_contains(size: int, bits: bytes, grams: Set[str]) -> bool:
+    """grams是否都可能在过滤器中（可能误报，不会漏报）"""
+    return all(bits[pos >> 3] >> (pos & 7) & 1 for gram in grams for pos in _bloom_positions(gram, size))
+
+
+def match_records(records: List[Dict], keywords: List[str]) -> List[Dict]:
+    """按关键词筛选记录，规则与热数据的搜索相同：包含任意一个关键词即命中"""
+    results = []
+    for record in records:
+        content_lower = record["content"].lower()
+        match_count = sum(1 for kw in keywords if kw in content_lower)
+        if match_count:
+            result = dict(record)
+            result["match_score"] = match_count
+            result["match_spans"] = find_spans(record["content"], keywords)
+            results.append(result)
+    return results
+
+
+class MemoryArchive:
+    """冷数据归档：因容量淘汰或过期删除的记忆按会话追加写入压缩文件
+
+    每个会话两个文件：<会话>.ndjson.gz 由若干gzip成员首尾相接组成（整个文件仍是合法的gzip，
+    可以直接用zcat查看），每次归档写一个成员；<会话>.idx 每行描述一个成员的位置、条数、
+    时间范围和内容n-gram的布隆过滤器。搜索时先用布隆过滤器排除不可能命中的成员，
+    只解压剩下的。先写数据再写索引，写到一半崩溃时多出的数据没有索引指向，不影响读取。
+    """
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        # 会话 -> (已读取的索引文件字节数, 索引条目)，索引文件只追加，增量读取
+        self._indexes: Dict[str, Tuple[int, List[Dict]]] = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, session_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.archive_dir, urllib.parse.quote(session_id, safe=""))
+        return base + ".ndjson.gz", base + ".idx"
+
+    def append(self, batches: Dict[str, List[Dict]]):
+        """把每个会话的一批记录写成一个gzip成员（在工作线程中调用）"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for session_id, records in batches.items():
+            if not records:
+                continue
+            data_path, index_path = self._paths(session_id)
+            lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            member = gzip.compress(lines.encode("utf-8"))
+            grams: Set[str] = set()
+            for record in records:
+                grams |= _content_grams(record["content"])
+            size, bits = build_bloom(grams)
+            timestamps = sorted(record.get("timestamp", "") for record in records)
+
+            with open(data_path, "ab") as f:
+                offset = f.tell()
+                f.write(member)
+                f.flush()
+                os.fsync(f.fileno())
+            entry = {
+                "offset": offset,
+                "length": len(member),
+                "count": len(records),
+                "first": timestamps[0],
+                "last": timestamps[-1],
+                "bloom_bits": size,
+                "bloom": bits.hex()
+            }
+            with open(index_path, "a", encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _load_index(self, session_id: str) -> List[Dict]:
+        """读取会话的索引，只解析上次读取之后追加的完整行"""
+        _, index_path = self._paths(session_id)
+        with self._lock:
+            read_bytes, entries = self._indexes.get(session_id, (0, []))
+            try:
+                with open(index_path, "rb") as f:
+                    f.seek(read_bytes)
+                    tail = f.read()
+            except FileNotFoundError:
+                return []
+            complete = tail[:tail.rfind(b"\n") + 1]
+            if complete:
+                new_entries = [json.loads(line) for line in complete.decode("utf-8").splitlines() if line]
+                for entry in new_entries:
+                    entry["bloom"] = bytes.fromhex(entry["bloom"])
+                entries = entries + new_entries
+                self._indexes[session_id] = (read_bytes + len(complete), entries)
+            return entries
+
+    def search(self, session_id: str, keywords: List[str]) -> List[Dict]:
+        """在会话的归档中搜索，返回命中记录（带 match_score 和 match_spans，未排序）"""
+        entries = self._load_index(session_id)
+        if not entries or not keywords:
+            return []
+
+        keyword_grams = [_keyword_grams(kw) for kw in keywords]
+        candidates = [entry for entry in entries
+                      if any(bloom_contains(entry["bloom_bits"], entry["bloom"], grams)
+                             for grams in keyword_grams)]
+        if not candidates:
+            return []
+
+        data_path, _ = self._paths(session_id)
+        results = []
+        with open(data_path, "rb") as f:
+            for entry in candidates:
+                f.seek(entry["offset"])
+                lines = gzip.decompress(f.read(entry["length"])).decode("utf-8").split("\n")
+                results.extend(match_records([json.loads(line) for line in lines if line], keywords))
+        return results
+
+    def stats(self, session_id: str) -> Dict:
+        """会话归档的成员数、记录数和压缩后大小"""
+        entries = self._load_index(session_id)
+        return {
+            "members": len(entries),
+            "records": sum(entry["count"] for entry in entries),
+            "bytes": sum(entry["length"] for entry in entries)
+        }
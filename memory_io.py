@@ -0,0 +1,188 @@
+"""记忆的NDJSON流式导入导出
+
+每行一条记忆：{"session_id": ..., "content": ..., "importance": ..., "timestamp": ..., "tags": [...]}
+
+也可以脱离AstrBot单独运行（在插件所在的plugins目录下执行）：
+    python -m strbot_plugin_play_sy.memory_io export data/memories/memory_data.json -o backup.ndjson
+    python -m strbot_plugin_play_sy.memory_io import data/memories/memory_data.json backup.ndjson
+"""
+import sys
+import json
+import asyncio
+import sqlite3
+import argparse
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from .memory_manager import MemoryManager
+from .time_index import parse_timestamp
+
+logger = logging.getLogger("astrbot")
+
+EXPORT_FIELDS = ("content", "importance", "timestamp", "tags", "memory_id")
+
+
+def iter_ndjson(sessions: Iterable[Tuple[str, List[Dict]]], session_filter: Optional[Set[str]] = None) -> Iterator[str]:
+    """把 (会话ID, 记忆列表) 序列逐行转成NDJSON，会话过滤在流中完成"""
+    for session_id, memories in sessions:
+        if session_filter and session_id not in session_filter:
+            continue
+        for memory in memories:
+            record = {"session_id": session_id}
+            record.update({key: memory[key] for key in EXPORT_FIELDS if key in memory})
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def export_ndjson(sessions: Iterable[Tuple[str, List[Dict]]], fp: TextIO,
+                  session_filter: Optional[Set[str]] = None) -> int:
+    """导出到文件对象，返回导出条数"""
+    count = 0
+    for line in iter_ndjson(sessions, session_filter):
+        fp.write(line)
+        count += 1
+    return count
+
+
+def _parse_record(line: str, session_id: Optional[str]) -> Optional[Dict]:
+    """解析并校验一行，不合法时返回None"""
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(record, dict):
+        return None
+
+    content = record.get("content")
+    if not isinstance(content, str) or not content.strip():
+        return None
+    target = session_id or record.get("session_id")
+    if not isinstance(target, str) or not target:
+        return None
+
+    importance = record.get("importance", 3)
+    if not isinstance(importance, int) or isinstance(importance, bool):
+        importance = 3
+    timestamp = record.get("timestamp")
+    if not isinstance(timestamp, str) or parse_timestamp(timestamp) is None:
+        timestamp = None
+    tags = record.get("tags")
+    if not isinstance(tags, list):
+        tags = []
+
+    return {
+        "session_id": target,
+        "content": content.strip(),
+        "importance": importance,
+        "timestamp": timestamp,
+        "tags": [tag for tag in tags if isinstance(tag, str)]
+    }
+
+
+async def _flush_chunk(manager: MemoryManager, chunk: List[Dict]) -> int:
+    """导入一批记录：标签提取放到线程里批量做，按会话加锁写入，最后只保存一次"""
+    auto_tags = await asyncio.to_thread(manager.extract_tags_batch, [r["content"] for r in chunk])
+    by_session: Dict[str, List[Dict]] = {}
+    for record, tags in zip(chunk, auto_tags):
+        record["tags"] = list(set(record["tags"] + tags))
+        by_session.setdefault(record.pop("session_id"), []).append(record)
+
+    imported = 0
+    for session_id, records in by_session.items():
+        async with manager.session_lock(session_id):
+            imported += manager.import_memories(session_id, records)
+    await manager.save_memories()
+    return imported
+
+
+async def import_ndjson(manager: MemoryManager, lines: Iterable[str], session_id: Optional[str] = None,
+                        chunk_size: int = 200) -> Tuple[int, int]:
+    """从NDJSON逐行导入，内存占用只与批大小有关
+
+    session_id 不为空时全部导入到该会话，否则使用每行自带的session_id。
+    返回 (导入条数, 跳过的无效行数)。
+    """
+    imported = 0
+    skipped = 0
+    chunk: List[Dict] = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = _parse_record(line, session_id)
+        if record is None:
+            skipped += 1
+            continue
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            imported += await _flush_chunk(manager, chunk)
+            chunk = []
+    if chunk:
+        imported += await _flush_chunk(manager, chunk)
+
+    logger.info(f"[memory_io] 导入完成 - 导入 {imported} 条，跳过 {skipped} 行")
+    return imported, skipped
+
+
+def iter_data_file(data_file: str) -> Iterator[Tuple[str, List[Dict]]]:
+    """逐个会话读取数据文件（.db为多进程共享模式的SQLite文件，逐行读取）"""
+    if data_file.endswith(".db"):
+        conn = sqlite3.connect(data_file)
+        try:
+            for session_id, data in conn.execute("SELECT session_id, data FROM sessions ORDER BY session_id"):
+                yield session_id, json.loads(data)
+        finally:
+            conn.close()
+        return
+
+    with open(data_file, "r", encoding='utf-8') as f:
+        yield from json.load(f).items()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="记忆数据的NDJSON导入导出")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    export_parser = subparsers.add_parser("export", help="导出为NDJSON")
+    export_parser.add_argument("data_file", help="memory_data.json 或共享模式下的 memory_data.db")
+    export_parser.add_argument("-o", "--output", default="-", help="输出文件，默认标准输出")
+    export_parser.add_argument("-s", "--session", action="append", help="只导出指定会话，可重复")
+
+    import_parser = subparsers.add_parser("import", help="从NDJSON导入")
+    import_parser.add_argument("data_file", help="要写入的 memory_data.json")
+    import_parser.add_argument("input", help="NDJSON文件，- 表示标准输入")
+    import_parser.add_argument("-s", "--session", help="全部导入到指定会话")
+    import_parser.add_argument("--chunk-size", type=int, default=200, help="每批导入条数")
+    import_parser.add_argument("--max-memories", type=int, default=100, help="每个会话最大记忆数")
+    import_parser.add_argument("--no-dedup", action="store_true", help="关闭近似重复合并")
+    import_parser.add_argument("--multi-process", action="store_true", help="写入多进程共享模式的SQLite存储")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.action == "export":
+        out = sys.stdout if args.output == "-" else open(args.output, "w", encoding='utf-8')
+        try:
+            count = export_ndjson(iter_data_file(args.data_file), out, set(args.session) if args.session else None)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"已导出 {count} 条记忆", file=sys.stderr)
+        return
+
+    config = {
+        "max_memories": args.max_memories,
+        "memory_expire_days": 0,
+        "dedup_enabled": not args.no_dedup,
+        "multi_process_mode": args.multi_process
+    }
+    manager = MemoryManager(args.data_file, config)
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding='utf-8')
+    try:
+        imported, skipped = asyncio.run(import_ndjson(manager, source, args.session, args.chunk_size))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print(f"已导入 {imported} 条记忆，跳过 {skipped} 行无效数据", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
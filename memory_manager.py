@@ -1,12 +1,59 @@
 import json
 import os
+import zlib
+import asyncio
+import time
+import tempfile
+import contextlib
 import datetime
 import logging
-from typing import List, Dict, Optional
+from collections import deque, OrderedDict
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass, asdict
 
+from .simhash_index import SimHashIndex
+from .shared_store import SharedMemoryStore
+from .tag_index import TagIndex, iter_bits
+from .time_index import TimeIndex
+from .snippet import find_spans
+from .fuzzy_index import FuzzyIndex
+from .memory_archive import MemoryArchive, match_records
+
 logger = logging.getLogger("astrbot")
 
+# 会话锁的分段数：会话按哈希落到固定数量的锁上，互不相关的会话基本不会互相等待
+LOCK_STRIPES = 64
+
+# 插入一条记忆的结果：新增、合并到已有记忆、新增后随即被全局容量淘汰进归档
+INSERT_ADDED = "added"
+INSERT_MERGED = "merged"
+INSERT_ARCHIVED = "archived"
+
+
+def atomic_write_text(path: str, text: str):
+    """原子写文件：先写临时文件并fsync，再rename覆盖，中途崩溃不会留下半截文件"""
+    # 临时文件名要唯一，多个线程或进程可能同时写同一个文件
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w", encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    
+    # 同步目录项，确保rename本身也落盘（Windows不支持打开目录，跳过）
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
 @dataclass
 class Memory:
     """记忆数据结构"""
@@ -23,13 +70,121 @@ class MemoryManager:
         self.data_file = data_file
         self.config = config
         self.memories: Dict[str, List[Dict]] = {}
+        # 按会话懒加载的索引，第一次用到时才构建
+        self._id_index: Dict[str, Dict[str, Dict]] = {}
+        self._simhash_indexes: Dict[str, SimHashIndex] = {}
+        self._tag_indexes: Dict[str, TagIndex] = {}
+        self._time_indexes: Dict[str, TimeIndex] = {}
+        # 拼音/错别字索引只在精确搜索落空时才需要，单独懒加载
+        self._fuzzy_indexes: Dict[str, FuzzyIndex] = {}
+        # 去重演练模式下命中的记录，只保留最近的若干条
+        self.dedup_report: Dict[str, deque] = {}
+        self._session_locks = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+        self._save_lock = asyncio.Lock()
+        # 保存请求计数，用来合并排队中的保存
+        self._save_requested = 0
+        self._save_completed = 0
+        # 多进程共享模式下的存储，以及保证本进程内同一时刻只有一个写事务的锁
+        self.store: Optional[SharedMemoryStore] = None
+        self._store_lock = asyncio.Lock()
+        # 全局用量：每个会话的 (记忆条数, 序列化字节数) 及合计
+        self._session_usage: Dict[str, Tuple[int, int]] = {}
+        self.total_records = 0
+        self.total_bytes = 0
+        # 会话最近访问时间，按访问先后排列，最久未访问的在最前
+        self.last_access: "OrderedDict[str, float]" = OrderedDict()
+        # 每个会话的版本号，任何修改都会递增，用来判断缓存的工具输出是否过期
+        self._versions: Dict[str, int] = {}
+        # 冷数据归档：被淘汰或过期的记忆先在这里排队，随下一次保存一起写入归档
+        self.archive = MemoryArchive(os.path.join(os.path.dirname(os.path.abspath(data_file)), "archive"))
+        self._archive_pending: Dict[str, List[Dict]] = {}
         self._load_memories()
+        self._init_usage()
+    
+    def _stripe_lock(self, session_id: str) -> asyncio.Lock:
+        """会话所在分段的锁（多个会话共用一把）"""
+        return self._session_locks[zlib.crc32(session_id.encode("utf-8")) % LOCK_STRIPES]
+    
+    @contextlib.asynccontextmanager
+    async def session_lock(self, session_id: str):
+        """持有会话锁，跨await的读改写操作需要在其中进行
+        
+        多进程共享模式下还会开启一个写事务：进入时同步其他进程的改动，
+        退出时把该会话写回共享存储，出错则回滚。
+        """
+        async with self._stripe_lock(session_id):
+            if self.store is None:
+                yield
+                return
+            
+            async with self._store_lock:
+                try:
+                    await self._run_store(self.store.begin)
+                    self._sync_from_store()
+                    yield
+                    self._clean_expired_session(session_id)
+                    self.store.write_session(session_id, self.memories.get(session_id, []))
+                    # 先归档再提交，中途崩溃最多是归档里多一份，不会丢失
+                    await self._flush_archive(self._take_archive_pending(session_id))
+                    await self._run_store(self.store.commit)
+                except BaseException:
+                    # _run_store 被取消时也会等线程执行完，这里连接不会再被其他线程使用；
+                    # begin 可能在取消之后才拿到写锁，commit 可能已经成功，以连接的实际状态为准
+                    if self.store.conn.in_transaction:
+                        self.store.rollback()
+                    # 内存里的改动没有写进去，从共享存储重新加载该会话；
+                    # 排队归档的记录在重新加载的热数据里还在，不能再归档一次
+                    self._archive_pending.pop(session_id, None)
+                    self._reload_session(session_id)
+                    raise
+    
+    @staticmethod
+    async def _run_store(func):
+        """在线程里执行一次共享存储操作
+        
+        调用方被取消时线程里的操作并不会停下（BEGIN IMMEDIATE 可能还在等其他进程的写锁），
+        因此等它执行完再把取消抛出去，保证之后看到的事务状态是确定的。
+        """
+        task = asyncio.ensure_future(asyncio.to_thread(func))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            while not task.done():
+                try:
+                    await asyncio.wait([task])
+                except asyncio.CancelledError:
+                    pass
+            if not task.cancelled():
+                # 取走线程里的异常（如果有），以取消为准向上抛
+                task.exception()
+            raise
+    
+    def _sync_from_store(self):
+        """同步其他进程改动过的会话（只在共享模式下生效）"""
+        if self.store is None:
+            return
+        for session_id, memories in self.store.fetch_changes().items():
+            if memories:
+                self.memories[session_id] = memories
+            else:
+                self.memories.pop(session_id, None)
+            self._drop_session_indexes(session_id)
+            logger.debug(f"[MemoryManager] 从共享存储同步会话 {session_id}，共 {len(memories)} 条记忆")
+    
+    def _reload_session(self, session_id: str):
+        """从共享存储重新加载单个会话"""
+        row = self.store.conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        memories = json.loads(row[0]) if row else []
+        if memories:
+            self.memories[session_id] = memories
+        else:
+            self.memories.pop(session_id, None)
+        self._drop_session_indexes(session_id)
     
     def _load_memories(self):
         """加载记忆数据"""
         if not os.path.exists(self.data_file):
-            with open(self.data_file, "w", encoding='utf-8') as f:
-                f.write("{}")
+            atomic_write_text(self.data_file, "{}")
         
         try:
             with open(self.data_file, "r", encoding='utf-8') as f:
@@ -37,54 +192,432 @@ class MemoryManager:
         except Exception as e:
             logger.error(f"加载记忆数据失败: {e}")
             self.memories = {}
+        
+        if self.config.get("multi_process_mode", False):
+            # 共享模式以SQLite为准，JSON文件只在第一次启用时用来迁移
+            self.store = SharedMemoryStore(os.path.splitext(self.data_file)[0] + ".db")
+            if self.store.is_empty() and self.memories:
+                self.store.import_all(self.memories)
+            self.memories = self.store.load_all()
+            logger.info(f"[MemoryManager] 已启用多进程共享模式，共 {len(self.memories)} 个会话")
     
     async def save_memories(self):
-        """保存记忆到文件"""
+        """保存记忆到文件
+        
+        序列化在事件循环里完成，得到的是某一时刻的完整快照；写盘放到线程里做。
+        排队期间如果已有更新的快照写完，本次保存直接跳过。
+        多进程共享模式下数据在释放会话锁时已经写入共享存储，这里无需再写。
+        """
+        if self.store is not None:
+            return
+        
+        self._save_requested += 1
+        request = self._save_requested
         try:
-            # 清理过期记忆
-            self._clean_expired_memories()
-            
-            with open(self.data_file, "w", encoding='utf-8') as f:
-                json.dump(self.memories, f, ensure_ascii=False, indent=2)
+            async with self._save_lock:
+                if self._save_completed >= request:
+                    return
+                
+                # 清理过期记忆
+                self._clean_expired_memories()
+                
+                covered = self._save_requested
+                # 取出待归档记录和生成快照之间没有await，快照里删掉的恰好就是这些记录
+                pending = self._take_archive_pending()
+                snapshot = json.dumps(self.memories, ensure_ascii=False, indent=2)
+                await self._flush_archive(pending)
+                await asyncio.to_thread(atomic_write_text, self.data_file, snapshot)
+                self._save_completed = covered
         except Exception as e:
             logger.error(f"保存记忆数据失败: {e}")
     
+    def _archive_memory(self, session_id: str, memory: Dict, reason: str):
+        """把即将从热数据中删除的记忆放进归档队列"""
+        if not self.config.get("archive_enabled", True):
+            return
+        record = dict(memory)
+        record["archived_at"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        record["archive_reason"] = reason
+        self._archive_pending.setdefault(session_id, []).append(record)
+    
+    def _take_archive_pending(self, session_id: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """取出待归档的记录（指定会话时只取该会话的）"""
+        if session_id is None:
+            pending, self._archive_pending = self._archive_pending, {}
+            return pending
+        records = self._archive_pending.pop(session_id, None)
+        return {session_id: records} if records else {}
+    
+    async def _flush_archive(self, pending: Dict[str, List[Dict]]):
+        """把待归档记录写入归档，失败时放回队列并抛出异常，调用方不应继续写热数据"""
+        if not pending:
+            return
+        try:
+            await asyncio.to_thread(self.archive.append, pending)
+        except Exception:
+            for session_id, records in pending.items():
+                self._archive_pending[session_id] = records + self._archive_pending.get(session_id, [])
+            raise
+        logger.debug(f"[MemoryManager] 归档 {sum(len(r) for r in pending.values())} 条记忆")
+    
     def _clean_expired_memories(self):
         """清理过期的记忆"""
         if not self.config.get("memory_expire_days", 0):
             return
         
+        for session_id in list(self.memories.keys()):
+            self._clean_expired_session(session_id)
+    
+    def _clean_expired_session(self, session_id: str):
+        """清理单个会话中过期的记忆"""
+        if not self.config.get("memory_expire_days", 0) or session_id not in self.memories:
+            return
+        
         expire_days = self.config["memory_expire_days"]
         current_time = datetime.datetime.now()
         
-        for session_id in list(self.memories.keys()):
-            memories = self.memories[session_id]
-            # 过滤掉过期的记忆
-            valid_memories = []
-            for memory in memories:
-                try:
-                    memory_time = datetime.datetime.strptime(memory["timestamp"], "%Y-%m-%d %H:%M:%S")
-                    if (current_time - memory_time).days < expire_days:
-                        valid_memories.append(memory)
-                except:
-                    # 如果时间格式错误，保留记忆
+        if session_id in self._time_indexes:
+            # 索引已构建时二分定位过期区间：(now - t).days >= expire_days 即 t <= now - expire_days天
+            cutoff = current_time - datetime.timedelta(days=expire_days)
+            for memory in self._remove_by_time(session_id, None, int(cutoff.timestamp())):
+                self._archive_memory(session_id, memory, "过期")
+            return
+        
+        memories = self.memories[session_id]
+        # 过滤掉过期的记忆
+        valid_memories = []
+        for memory in memories:
+            try:
+                memory_time = datetime.datetime.strptime(memory["timestamp"], "%Y-%m-%d %H:%M:%S")
+                if (current_time - memory_time).days < expire_days:
                     valid_memories.append(memory)
-            
-            if valid_memories:
-                self.memories[session_id] = valid_memories
-            else:
+                else:
+                    self._unindex_memory(session_id, memory)
+                    self._archive_memory(session_id, memory, "过期")
+            except:
+                # 如果时间格式错误，保留记忆
+                valid_memories.append(memory)
+        
+        if valid_memories:
+            self.memories[session_id] = valid_memories
+        else:
+            del self.memories[session_id]
+            self._drop_session_indexes(session_id)
+    
+    def _ensure_indexes(self, session_id: str):
+        """确保会话的索引已构建"""
+        if session_id in self._id_index:
+            return
+        
+        id_index: Dict[str, Dict] = {}
+        simhash_index = SimHashIndex()
+        tag_index = TagIndex()
+        time_index = TimeIndex()
+        for memory in self.memories.get(session_id, []):
+            # 旧数据的memory_id只精确到秒，同一秒保存的记忆会重复，这里顺便修正
+            memory_id = memory.get("memory_id")
+            if not memory_id or memory_id in id_index:
+                memory_id = self._new_memory_id(session_id, id_index)
+                memory["memory_id"] = memory_id
+            id_index[memory_id] = memory
+            simhash_index.add(memory_id, memory["content"])
+            tag_index.add(memory_id, memory.get("tags", ["其他"]))
+            time_index.add(memory_id, memory["timestamp"])
+        
+        self._id_index[session_id] = id_index
+        self._simhash_indexes[session_id] = simhash_index
+        self._tag_indexes[session_id] = tag_index
+        self._time_indexes[session_id] = time_index
+        logger.debug(f"[MemoryManager] 为会话 {session_id} 构建索引，共 {len(id_index)} 条记忆")
+    
+    def _ensure_fuzzy_index(self, session_id: str) -> FuzzyIndex:
+        """确保会话的拼音/错别字索引已构建"""
+        self._ensure_indexes(session_id)
+        fuzzy_index = self._fuzzy_indexes.get(session_id)
+        if fuzzy_index is None:
+            fuzzy_index = FuzzyIndex()
+            for memory_id, memory in self._id_index[session_id].items():
+                fuzzy_index.add(memory_id, memory["content"])
+            self._fuzzy_indexes[session_id] = fuzzy_index
+            logger.debug(f"[MemoryManager] 为会话 {session_id} 构建拼音索引，共 {len(fuzzy_index.texts)} 条记忆")
+        return fuzzy_index
+    
+    def _index_memory(self, session_id: str, memory: Dict):
+        """把记忆加入会话索引（索引尚未构建时跳过，等用到时再整体构建）"""
+        self._bump_version(session_id)
+        self._account_memory(session_id, memory, 1)
+        if session_id not in self._id_index:
+            return
+        self._id_index[session_id][memory["memory_id"]] = memory
+        self._simhash_indexes[session_id].add(memory["memory_id"], memory["content"])
+        self._tag_indexes[session_id].add(memory["memory_id"], memory.get("tags", ["其他"]))
+        self._time_indexes[session_id].add(memory["memory_id"], memory["timestamp"])
+        if session_id in self._fuzzy_indexes:
+            self._fuzzy_indexes[session_id].add(memory["memory_id"], memory["content"])
+    
+    def _unindex_memory(self, session_id: str, memory: Dict):
+        """把记忆从会话索引中移除"""
+        self._bump_version(session_id)
+        self._account_memory(session_id, memory, -1)
+        if session_id not in self._id_index:
+            return
+        self._id_index[session_id].pop(memory.get("memory_id"), None)
+        self._simhash_indexes[session_id].remove(memory.get("memory_id"))
+        self._tag_indexes[session_id].remove(memory.get("memory_id"))
+        self._time_indexes[session_id].remove(memory.get("memory_id"), memory.get("timestamp"))
+        if session_id in self._fuzzy_indexes:
+            self._fuzzy_indexes[session_id].remove(memory.get("memory_id"))
+    
+    def _drop_session_indexes(self, session_id: str):
+        """会话数据被整体替换或删除时，丢弃它的全部索引并重新统计用量"""
+        self._bump_version(session_id)
+        self._id_index.pop(session_id, None)
+        self._simhash_indexes.pop(session_id, None)
+        self._tag_indexes.pop(session_id, None)
+        self._time_indexes.pop(session_id, None)
+        self._fuzzy_indexes.pop(session_id, None)
+        self._recount_session(session_id)
+    
+    def _bump_version(self, session_id: str):
+        # 会话被删除后也保留版本号，保证同一会话的版本号只增不减
+        self._versions[session_id] = self._versions.get(session_id, 0) + 1
+    
+    def get_session_version(self, session_id: str) -> int:
+        """会话当前的版本号（共享模式下会先同步其他进程的改动，并记录一次访问）"""
+        self.get_memories(session_id)
+        return self._versions.get(session_id, 0)
+    
+    @staticmethod
+    def _memory_size(memory: Dict) -> int:
+        """记忆序列化后的字节数"""
+        return len(json.dumps(memory, ensure_ascii=False).encode("utf-8"))
+    
+    def _account_memory(self, session_id: str, memory: Dict, sign: int):
+        """增量更新用量统计，sign为1表示加入，-1表示移除"""
+        size = self._memory_size(memory) * sign
+        count, total = self._session_usage.get(session_id, (0, 0))
+        self._session_usage[session_id] = (count + sign, total + size)
+        self.total_records += sign
+        self.total_bytes += size
+    
+    def _recount_session(self, session_id: str):
+        """重新统计单个会话的用量"""
+        count, total = self._session_usage.pop(session_id, (0, 0))
+        self.total_records -= count
+        self.total_bytes -= total
+        
+        memories = self.memories.get(session_id)
+        if not memories:
+            self.last_access.pop(session_id, None)
+            return
+        
+        count = len(memories)
+        total = sum(self._memory_size(m) for m in memories)
+        self._session_usage[session_id] = (count, total)
+        self.total_records += count
+        self.total_bytes += total
+        if session_id not in self.last_access:
+            # 没在本进程访问过的会话（如其他进程同步过来的）视为最久未访问
+            self.last_access[session_id] = 0.0
+            self.last_access.move_to_end(session_id, last=False)
+    
+    def _init_usage(self):
+        """启动时统计全部会话的用量，并按最新记忆时间初始化访问顺序"""
+        def newest(session_id: str) -> str:
+            return max((m.get("timestamp", "") for m in self.memories[session_id]), default="")
+        
+        self.last_access.clear()
+        for session_id in sorted(self.memories, key=newest):
+            self.last_access[session_id] = 0.0
+        for session_id in list(self.memories):
+            self._recount_session(session_id)
+        logger.info(f"[MemoryManager] 共 {len(self.memories)} 个会话，{self.total_records} 条记忆，{self.total_bytes / 1024:.1f}KB")
+    
+    def _touch_session(self, session_id: str):
+        """记录会话被访问"""
+        if session_id in self.memories:
+            self.last_access[session_id] = time.time()
+            self.last_access.move_to_end(session_id)
+    
+    def _over_global_budget(self) -> bool:
+        max_records = self.config.get("global_max_memories", 0)
+        max_bytes = self.config.get("global_max_mb", 0) * 1024 * 1024
+        return bool((max_records and self.total_records > max_records) or
+                    (max_bytes and self.total_bytes > max_bytes))
+    
+    def _enforce_global_budget(self, current_session: str) -> int:
+        """超出全局预算时跨会话淘汰：先找最久未访问的会话，会话内按重要性从低到高、从旧到新删除
+        
+        当前会话排在最后，只有其他会话都删空了才会动它。返回淘汰条数。
+        其他会话的锁正被别的操作持有时（如导出正在线程里遍历它的记忆）跳过该会话，
+        与当前会话共用一把锁的会话由调用方持有，可以淘汰；这样可能暂时超出预算，下次插入时再淘汰。
+        多进程共享模式下其他会话不在本进程的写事务里，不做跨会话淘汰。
+        """
+        if self.store is not None or not self._over_global_budget():
+            return 0
+        
+        evicted = 0
+        current_lock = self._stripe_lock(current_session)
+        candidates = [sid for sid in self.last_access if sid != current_session and
+                      (self._stripe_lock(sid) is current_lock or not self._stripe_lock(sid).locked())]
+        candidates.append(current_session)
+        for session_id in candidates:
+            memories = self.memories.get(session_id)
+            if not memories:
+                continue
+            for victim in sorted(memories, key=lambda x: (x["importance"], x["timestamp"])):
+                if not self._over_global_budget():
+                    break
+                self._evict_memory(session_id, victim, "全局容量超限")
+                evicted += 1
+            if not self.memories[session_id]:
                 del self.memories[session_id]
+                self._drop_session_indexes(session_id)
+            if not self._over_global_budget():
+                break
+        
+        if evicted:
+            logger.info(f"[MemoryManager] 全局容量超限，跨会话淘汰 {evicted} 条记忆")
+        return evicted
+    
+    def _evict_memory(self, session_id: str, memory: Dict, reason: str):
+        """因容量限制删除一条记忆"""
+        self.memories[session_id].remove(memory)
+        self._unindex_memory(session_id, memory)
+        self._archive_memory(session_id, memory, reason)
+        logger.info(f"[MemoryManager] {reason}，删除记忆: {memory['content'][:50]}... (重要性:{memory['importance']})")
+    
+    def get_global_stats(self) -> Dict:
+        """获取全局用量及与预算的距离"""
+        max_records = self.config.get("global_max_memories", 0)
+        max_bytes = self.config.get("global_max_mb", 0) * 1024 * 1024
+        return {
+            "sessions": len(self.memories),
+            "records": self.total_records,
+            "bytes": self.total_bytes,
+            "max_records": max_records,
+            "max_bytes": max_bytes,
+            "record_usage": round(self.total_records / max_records, 4) if max_records else None,
+            "byte_usage": round(self.total_bytes / max_bytes, 4) if max_bytes else None
+        }
+    
+    def _new_memory_id(self, session_id: str, existing: Optional[Dict[str, Dict]] = None) -> str:
+        """生成会话内唯一的记忆ID"""
+        if existing is None:
+            existing = self._id_index.get(session_id, {})
+        memory_id = f"{session_id}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+        if memory_id not in existing:
+            return memory_id
+        
+        suffix = 1
+        while f"{memory_id}_{suffix}" in existing:
+            suffix += 1
+        return f"{memory_id}_{suffix}"
+    
+    def get_memory_by_id(self, session_id: str, memory_id: str) -> Optional[Dict]:
+        """按ID获取记忆"""
+        self._ensure_indexes(session_id)
+        return self._id_index[session_id].get(memory_id)
     
-    def add_memory(self, session_id: str, content: str, importance: int = 1, tags: List[str] = None) -> bool:
-        """添加记忆，支持标签"""
+    def _find_near_duplicate(self, session_id: str, content: str) -> Optional[Tuple[Dict, float]]:
+        """查找与内容近似重复的已有记忆"""
+        if not self.config.get("dedup_enabled", True):
+            return None
+        
+        self._ensure_indexes(session_id)
+        threshold = self.config.get("dedup_threshold", 0.85)
+        matches = self._simhash_indexes[session_id].find_similar(content, threshold)
+        if not matches:
+            return None
+        
+        memory_id, score = matches[0]
+        return self._id_index[session_id][memory_id], score
+    
+    def _merge_duplicate(self, session_id: str, existing: Dict, content: str, importance: int, tags: List[str],
+                         timestamp: Optional[str] = None):
+        """把重复的记忆合并到已有记忆：换成较新的内容、提升重要性、刷新时间、合并标签
+        
+        近似重复常常只是改了一个事实（如日期），新内容才是准确的，不能丢掉；
+        导入的记录比已有记忆旧时保留原内容。
+        """
+        self._unindex_memory(session_id, existing)
+        existing["importance"] = max(existing["importance"], min(max(importance, 1), 5))
+        timestamp = timestamp or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if timestamp >= existing["timestamp"]:
+            existing["content"] = content
+            existing["timestamp"] = timestamp
+        existing["tags"] = list(set(existing.get("tags", []) + tags))
+        self._index_memory(session_id, existing)
+    
+    def add_memory(self, session_id: str, content: str, importance: int = 1,
+                   tags: List[str] = None) -> Tuple[Optional[str], Optional[str]]:
+        """添加记忆，支持标签
+        
+        返回 (插入结果, 被合并的已有记忆的原内容)，插入结果见 INSERT_*，功能禁用时为None；
+        只有合并时第二项不为None。
+        """
         if not self.config.get("enable_memory_management", True):
             logger.warning("[MemoryManager] 记忆管理功能已禁用")
-            return False
+            return None, None
         
+        # 合并自定义标签和自动提取的标签
+        auto_tags = self._extract_tags(content)
+        if tags:
+            # 用户自定义标签优先，然后添加自动提取的标签（去重）
+            all_tags = list(set(tags + auto_tags))
+            logger.debug(f"[MemoryManager] 标签合并 - 自定义: {tags}, 自动: {auto_tags}, 最终: {all_tags}")
+        else:
+            all_tags = auto_tags
+            logger.debug(f"[MemoryManager] 自动提取标签: {all_tags}")
+        
+        return self._insert_memory(session_id, content, importance, all_tags)
+    
+    def import_memories(self, session_id: str, records: List[Dict]) -> int:
+        """批量导入记忆，记录需已带好最终标签，可带原时间戳；返回导入条数（含合并）"""
+        if not self.config.get("enable_memory_management", True):
+            logger.warning("[MemoryManager] 记忆管理功能已禁用")
+            return 0
+        
+        for record in records:
+            self._insert_memory(session_id, record["content"], record.get("importance", 1),
+                                record.get("tags", []), record.get("timestamp"))
+        logger.info(f"[MemoryManager] 批量导入记忆 - 会话: {session_id}, 共 {len(records)} 条")
+        return len(records)
+    
+    def extract_tags_batch(self, contents: List[str]) -> List[List[str]]:
+        """批量提取标签"""
+        return [self._extract_tags(content) for content in contents]
+    
+    def _insert_memory(self, session_id: str, content: str, importance: int, all_tags: List[str],
+                       timestamp: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """插入一条标签已确定的记忆：先做近似去重，再按容量淘汰，最后追加
+        
+        返回 (插入结果, 被合并的已有记忆的原内容)。新记忆在全局预算中排最末
+        （其他会话无可淘汰、它又是本会话最不重要最旧的一条）时会被立即归档，结果为 INSERT_ARCHIVED。
+        """
         if session_id not in self.memories:
             self.memories[session_id] = []
             logger.debug(f"[MemoryManager] 为会话 {session_id} 创建新的记忆列表")
         
+        # 近似重复检测：命中时合并到已有记忆，而不是再追加一条
+        duplicate = self._find_near_duplicate(session_id, content)
+        if duplicate:
+            existing, score = duplicate
+            if self.config.get("dedup_dry_run", False):
+                report = self.dedup_report.setdefault(session_id, deque(maxlen=50))
+                report.append({
+                    "content": content,
+                    "duplicate_of": existing["content"],
+                    "similarity": round(score, 3),
+                    "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                })
+                logger.info(f"[MemoryManager] [演练] 检测到近似重复记忆 (相似度:{score:.2f}): {content[:50]}... ≈ {existing['content'][:50]}...")
+            else:
+                old_content = existing["content"]
+                self._merge_duplicate(session_id, existing, content, importance, all_tags, timestamp)
+                logger.info(f"[MemoryManager] 合并近似重复记忆 - ID: {existing['memory_id']}, 相似度: {score:.2f}, 重要性: {existing['importance']}")
+                return INSERT_MERGED, old_content
+        
         max_memories = self.config.get("max_memories", 100)
         current_count = len(self.memories[session_id])
         logger.debug(f"[MemoryManager] 当前会话记忆数: {current_count}/{max_memories}")
@@ -98,35 +631,29 @@ class MemoryManager:
             low_importance = [m for m in self.memories[session_id] if m["importance"] <= 3]
             if low_importance:
                 # 删除最旧的低重要性记忆
-                removed = low_importance[0]
-                self.memories[session_id].remove(removed)
-                logger.info(f"[MemoryManager] 删除低重要性记忆: {removed['content'][:50]}... (重要性:{removed['importance']})")
+                self._evict_memory(session_id, low_importance[0], "会话记忆数超限")
             else:
                 # 如果都是高重要性记忆，删除最旧的
-                removed = self.memories[session_id].pop(0)
-                logger.info(f"[MemoryManager] 删除最旧记忆: {removed['content'][:50]}... (重要性:{removed['importance']})")
-        
-        # 合并自定义标签和自动提取的标签
-        auto_tags = self._extract_tags(content)
-        if tags:
-            # 用户自定义标签优先，然后添加自动提取的标签（去重）
-            all_tags = list(set(tags + auto_tags))
-            logger.debug(f"[MemoryManager] 标签合并 - 自定义: {tags}, 自动: {auto_tags}, 最终: {all_tags}")
-        else:
-            all_tags = auto_tags
-            logger.debug(f"[MemoryManager] 自动提取标签: {all_tags}")
+                self._evict_memory(session_id, self.memories[session_id][0], "会话记忆数超限")
         
+        self._ensure_indexes(session_id)
         memory = {
             "content": content,
             "importance": min(max(importance, 1), 5),
-            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "memory_id": f"{session_id}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}",
+            "timestamp": timestamp or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "memory_id": self._new_memory_id(session_id),
             "tags": all_tags
         }
         
         self.memories[session_id].append(memory)
+        self._index_memory(session_id, memory)
+        self._touch_session(session_id)
         logger.info(f"[MemoryManager] 成功添加记忆 - ID: {memory['memory_id']}, 重要性: {memory['importance']}, 标签数: {len(all_tags)}")
-        return True
+        self._enforce_global_budget(session_id)
+        if self._id_index.get(session_id, {}).get(memory["memory_id"]) is not memory:
+            logger.warning(f"[MemoryManager] 全局容量已满，新记忆随即被淘汰进归档: {content[:50]}...")
+            return INSERT_ARCHIVED, None
+        return INSERT_ADDED, None
     
     def _extract_tags(self, content: str) -> List[str]:
         """智能提取标签 - 基于内容动态生成"""
@@ -216,6 +743,10 @@ class MemoryManager:
         if not self.config.get("enable_memory_management", True):
             return []
         
+        # 共享模式下读之前先看一眼有没有其他进程的改动；有写事务在进行时由它负责同步
+        if self.store is not None and not self._store_lock.locked():
+            self._sync_from_store()
+        self._touch_session(session_id)
         return self.memories.get(session_id, [])
     
     def get_memories_sorted(self, session_id: str) -> List[Dict]:
@@ -232,15 +763,145 @@ class MemoryManager:
         if index < 0 or index >= len(memories):
             return None
         
-        return memories.pop(index)
+        removed = memories.pop(index)
+        self._unindex_memory(session_id, removed)
+        return removed
+    
+    def edit_memory(self, session_id: str, index: int, content: str) -> Optional[str]:
+        """编辑指定序号的记忆内容，返回原内容"""
+        if session_id not in self.memories:
+            return None
+        
+        memories = self.memories[session_id]
+        if index < 0 or index >= len(memories):
+            return None
+        
+        memory = memories[index]
+        old_content = memory["content"]
+        self._unindex_memory(session_id, memory)
+        memory["content"] = content
+        self._index_memory(session_id, memory)
+        return old_content
+    
+    def _remove_by_time(self, session_id: str, start: Optional[int], end: Optional[int]) -> List[Dict]:
+        """按时间区间 [start, end]（epoch秒）删除记忆，返回被删除的记忆"""
+        self._ensure_indexes(session_id)
+        removed_ids = self._time_indexes[session_id].pop_between(start, end)
+        if not removed_ids:
+            return []
+        
+        id_index = self._id_index[session_id]
+        removed = [id_index[memory_id] for memory_id in removed_ids]
+        for memory in removed:
+            self._unindex_memory(session_id, memory)
+        
+        removed_set = set(removed_ids)
+        kept = [m for m in self.memories[session_id] if m["memory_id"] not in removed_set]
+        if kept:
+            self.memories[session_id] = kept
+        else:
+            del self.memories[session_id]
+            self._drop_session_indexes(session_id)
+        return removed
+    
+    def remove_memories_before(self, session_id: str, cutoff: datetime.datetime) -> int:
+        """删除指定时间之前的记忆（移入归档），返回删除数量"""
+        if not self.memories.get(session_id):
+            return 0
+        
+        # 时间戳是整秒，早于cutoff即不晚于 ceil(cutoff) - 1
+        end = int(cutoff.timestamp())
+        if end == cutoff.timestamp():
+            end -= 1
+        removed = self._remove_by_time(session_id, None, end)
+        for memory in removed:
+            self._archive_memory(session_id, memory, "清理旧记忆")
+        return len(removed)
+    
+    def get_memories_between(self, session_id: str, start: Optional[datetime.datetime] = None,
+                             end: Optional[datetime.datetime] = None) -> List[Dict]:
+        """获取时间在 [start, end] 内的记忆，按时间升序"""
+        if not self.get_memories(session_id):
+            return []
+        
+        self._ensure_indexes(session_id)
+        id_index = self._id_index[session_id]
+        memory_ids = self._time_indexes[session_id].between(
+            int(start.timestamp()) if start else None,
+            int(end.timestamp()) if end else None
+        )
+        return [id_index[memory_id] for memory_id in memory_ids]
+    
+    def replace_memories(self, session_id: str, originals: List[Dict], content: str,
+                         importance: int, tags: List[str], timestamp: str) -> bool:
+        """用一条新记忆替换多条记忆（记忆整理用）
+        
+        originals 是生成摘要时看到的记忆副本。任一条已不存在，或内容、重要性、时间、标签
+        与副本不同（期间被编辑、调整重要性或合并过，ID不变）时放弃替换。
+        """
+        self._ensure_indexes(session_id)
+        id_index = self._id_index[session_id]
+        if not originals:
+            return False
+        for original in originals:
+            memory = id_index.get(original["memory_id"])
+            if memory is None or any(memory.get(key) != original.get(key)
+                                     for key in ("content", "importance", "timestamp", "tags")):
+                return False
+        
+        memory_ids = [original["memory_id"] for original in originals]
+        to_remove = set(memory_ids)
+        for memory_id in memory_ids:
+            self._unindex_memory(session_id, id_index[memory_id])
+        self.memories[session_id] = [m for m in self.memories[session_id] if m["memory_id"] not in to_remove]
+        
+        memory = {
+            "content": content,
+            "importance": min(max(importance, 1), 5),
+            "timestamp": timestamp,
+            "memory_id": self._new_memory_id(session_id),
+            "tags": tags,
+            "consolidated_count": len(memory_ids)
+        }
+        self.memories[session_id].append(memory)
+        self._index_memory(session_id, memory)
+        logger.info(f"[MemoryManager] 整理记忆 - 会话: {session_id}, {len(memory_ids)} 条合并为 1 条: {content[:50]}...")
+        return True
     
     def clear_memories(self, session_id: str) -> bool:
         """清空指定会话的所有记忆"""
         if session_id in self.memories:
             del self.memories[session_id]
+            self._drop_session_indexes(session_id)
             return True
         return False
     
+    def find_duplicate_groups(self, session_id: str) -> List[List[Dict]]:
+        """扫描会话中已存在的近似重复记忆（只报告，不修改）"""
+        memories = self.get_memories(session_id)
+        if not memories:
+            return []
+        
+        self._ensure_indexes(session_id)
+        threshold = self.config.get("dedup_threshold", 0.85)
+        simhash_index = self._simhash_indexes[session_id]
+        seen = set()
+        groups = []
+        for memory in memories:
+            memory_id = memory["memory_id"]
+            if memory_id in seen:
+                continue
+            matches = simhash_index.query(simhash_index.fingerprints[memory_id], threshold)
+            group = [self._id_index[session_id][mid] for mid, _ in matches if mid not in seen]
+            if len(group) > 1:
+                groups.append(group)
+                seen.update(m["memory_id"] for m in group)
+        return groups
+    
+    def get_dedup_report(self, session_id: str) -> List[Dict]:
+        """获取演练模式下记录的近似重复命中"""
+        return list(self.dedup_report.get(session_id, []))
+    
     def update_memory_importance(self, session_id: str, index: int, importance: int) -> bool:
         """更新记忆的重要性"""
         if session_id not in self.memories:
@@ -251,10 +912,15 @@ class MemoryManager:
             return False
         
         memories[index]["importance"] = min(max(importance, 1), 5)
+        self._bump_version(session_id)
         return True
     
     def search_memories(self, session_id: str, keyword: str) -> List[Dict]:
-        """搜索记忆，支持多关键词"""
+        """搜索记忆，支持多关键词
+        
+        返回的是记忆的副本，附带 match_spans 字段：命中关键词在原文中的 [起, 止) 位置。
+        精确匹配没有结果且开启了模糊搜索时，改用拼音/错别字索引，此时结果带有 fuzzy_match 字段。
+        """
         memories = self.get_memories(session_id)
         if not keyword:
             logger.debug(f"[MemoryManager] 搜索关键词为空，返回所有 {len(memories)} 条记忆")
@@ -274,9 +940,21 @@ class MemoryManager:
                 match_count = sum(1 for kw in keywords if kw in content_lower)
                 memory_copy = memory.copy()
                 memory_copy['match_score'] = match_count
+                memory_copy['match_spans'] = find_spans(memory["content"], keywords)
                 results.append(memory_copy)
                 logger.debug(f"[MemoryManager] 匹配记忆: {memory['content'][:50]}... (匹配度:{match_count}, 重要性:{memory['importance']})")
         
+        if not results and memories and self.config.get("fuzzy_search_enabled", True):
+            fuzzy_index = self._ensure_fuzzy_index(session_id)
+            id_index = self._id_index[session_id]
+            for memory_id, match_count, spans in fuzzy_index.search(keywords):
+                memory_copy = id_index[memory_id].copy()
+                memory_copy['match_score'] = match_count
+                memory_copy['match_spans'] = spans
+                memory_copy['fuzzy_match'] = True
+                results.append(memory_copy)
+            logger.info(f"[MemoryManager] 精确搜索无结果，模糊搜索找到 {len(results)} 条记忆")
+        
         # 按匹配度和重要性排序
         results.sort(key=lambda x: (x.get('match_score', 0), x["importance"]), reverse=True)
         
@@ -293,6 +971,29 @@ class MemoryManager:
         
         return results
     
+    async def search_archive(self, session_id: str, keyword: str) -> List[Dict]:
+        """在归档（被淘汰或过期的旧记忆）中搜索，按匹配度和归档时间排序
+        
+        读文件和解压在线程里做；还在队列里没写入的记录也会一起搜索。
+        """
+        keywords = keyword.lower().split()
+        if not keywords:
+            return []
+        pending = list(self._archive_pending.get(session_id, []))
+        results = await asyncio.to_thread(self.archive.search, session_id, keywords)
+        results.extend(match_records(pending, keywords))
+        results.sort(key=lambda x: (x["match_score"], x.get("archived_at", "")), reverse=True)
+        for result in results:
+            result.pop("match_score", None)
+        logger.info(f"[MemoryManager] 搜索归档 - 会话: {session_id}, 关键词: {keywords}, 找到 {len(results)} 条")
+        return results
+    
+    async def get_archive_stats(self, session_id: str) -> Dict:
+        """会话归档的记录数和压缩后大小（含尚未写入的记录）"""
+        stats = await asyncio.to_thread(self.archive.stats, session_id)
+        stats["records"] += len(self._archive_pending.get(session_id, []))
+        return stats
+    
     def get_memory_stats(self, session_id: str) -> Dict:
         """获取记忆统计信息"""
         memories = self.get_memories(session_id)
@@ -331,21 +1032,44 @@ class MemoryManager:
         if not tag:
             return memories
         
-        # 搜索包含指定标签的记忆
-        results = [memory for memory in memories if tag in memory.get("tags", [])]
+        # 从标签位图取出包含指定标签的记忆
+        self._ensure_indexes(session_id)
+        tag_index = self._tag_indexes[session_id]
+        id_index = self._id_index[session_id]
+        results = [id_index[tag_index.slot_ids[slot]] for slot in iter_bits(tag_index.tag_bits(tag))]
         
         # 按重要性排序
         results.sort(key=lambda x: x["importance"], reverse=True)
         
         return results
     
+    def query_tags(self, session_id: str, expression: str) -> List[Dict]:
+        """按标签表达式查询记忆，支持 AND/OR/NOT、括号和前缀（如 事件:*）
+        
+        表达式有语法错误时抛出 ValueError。
+        """
+        if not self.get_memories(session_id):
+            return []
+        
+        self._ensure_indexes(session_id)
+        id_index = self._id_index[session_id]
+        results = [id_index[memory_id] for memory_id in self._tag_indexes[session_id].query(expression)]
+        results.sort(key=lambda x: (x["importance"], x["timestamp"]), reverse=True)
+        logger.info(f"[MemoryManager] 标签查询 - 会话: {session_id}, 表达式: {expression}, 命中 {len(results)} 条")
+        return results
+    
+    def get_tag_counts(self, session_id: str) -> Dict[str, int]:
+        """获取每个标签下的记忆数量"""
+        if not self.get_memories(session_id):
+            return {}
+        
+        self._ensure_indexes(session_id)
+        return self._tag_indexes[session_id].tag_counts()
+    
     def get_all_tags(self, session_id: str) -> List[str]:
         """获取所有标签"""
-        memories = self.get_memories(session_id)
-        tags = set()
-        
-        for memory in memories:
-            for tag in memory.get("tags", ["其他"]):
-                tags.add(tag)
+        if not self.get_memories(session_id):
+            return []
         
-        return sorted(list(tags))
\ No newline at end of file
+        self._ensure_indexes(session_id)
+        return self._tag_indexes[session_id].all_tags()
\ No newline at end of file
@@ -0,0 +1,105 @@
+import json
+import sqlite3
+import logging
+from typing import List, Dict, Optional
+
+logger = logging.getLogger("astrbot")
+
+
+class SharedMemoryStore:
+    """多进程共享的记忆存储
+
+    多个AstrBot进程共用同一个SQLite文件（WAL模式），每个会话一行。
+    每次写入都会递增全局版本号，并把该会话的版本设为新版本号；其他进程只需比较
+    全局版本号就能知道有没有变化，有变化时也只重新读取版本号更大的会话。
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        # 事务由调用方显式控制；连接会在工作线程里使用，由调用方保证串行
+        self.conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+        # 本进程已经同步到的全局版本号
+        self.seen_version = 0
+        # 当前写事务写入的版本号，提交成功后才算已同步；回滚时丢弃，
+        # 否则其他进程之后复用这个版本号提交的改动会被当成已经见过而漏掉
+        self._pending_version: Optional[int] = None
+
+    def current_version(self) -> int:
+        """读取全局版本号"""
+        return self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None
+
+    def fetch_changes(self) -> Dict[str, List[Dict]]:
+        """读取其他进程改动过的会话，没有变化时只需一次主键查询"""
+        version = self.current_version()
+        if version == self.seen_version:
+            return {}
+
+        rows = self.conn.execute(
+            "SELECT session_id, data FROM sessions WHERE version > ?", (self.seen_version,)
+        ).fetchall()
+        self.seen_version = version
+        return {session_id: json.loads(data) for session_id, data in rows}
+
+    def begin(self):
+        """开启写事务，立即拿到写锁，其他进程的写事务会在这里排队"""
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self.conn.execute("COMMIT")
+        if self._pending_version is not None:
+            self.seen_version = self._pending_version
+            self._pending_version = None
+
+    def rollback(self):
+        self._pending_version = None
+        self.conn.execute("ROLLBACK")
+
+    def write_session(self, session_id: str, memories: List[Dict]):
+        """写入一个会话（需在事务内调用，且调用前已同步过其他进程的改动）
+
+        会话被清空时保留一行空列表，其他进程才能感知到删除。
+        """
+        version = self.current_version() + 1
+        self.conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, version, data) VALUES (?, ?, ?)",
+            (session_id, version, json.dumps(memories, ensure_ascii=False))
+        )
+        self._pending_version = version
+
+    def import_all(self, memories: Dict[str, List[Dict]]):
+        """把已有的记忆数据整体导入（首次启用共享模式时从JSON文件迁移）"""
+        self.begin()
+        try:
+            # 多个进程同时启动时只有第一个拿到写锁的会导入
+            if not self.is_empty():
+                self.rollback()
+                return
+            for session_id, session_memories in memories.items():
+                self.write_session(session_id, session_memories)
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+        logger.info(f"[SharedMemoryStore] 已导入 {len(memories)} 个会话的记忆")
+
+    def load_all(self) -> Dict[str, List[Dict]]:
+        """读取全部会话"""
+        self.seen_version = self.current_version()
+        rows = self.conn.execute("SELECT session_id, data FROM sessions").fetchall()
+        return {session_id: memories for session_id, memories in
+                ((session_id, json.loads(data)) for session_id, data in rows) if memories}
+
+    def close(self):
+        self.conn.close()
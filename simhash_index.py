@@ -0,0 +1,113 @@
+import re
+import hashlib
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 2
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def _normalize(text: str) -> str:
+    """归一化文本：小写并去掉空白和标点"""
+    return _NON_WORD.sub("", text.lower())
+
+
+def _shingles(text: str) -> Counter:
+    """按字符切分shingle（中文按字切分效果比按词好）"""
+    text = _normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return Counter([text]) if text else Counter()
+    return Counter(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+
+
+def _hash64(token: str) -> int:
+    # 不能用内置hash()，它在不同进程间是随机化的
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """计算文本的64位SimHash指纹"""
+    weights = [0] * FINGERPRINT_BITS
+    for token, count in _shingles(text).items():
+        h = _hash64(token)
+        for bit in range(FINGERPRINT_BITS):
+            if h >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def similarity(a: int, b: int) -> float:
+    """两个指纹的相似度（1 - 汉明距离/64）"""
+    return 1 - bin(a ^ b).count("1") / FINGERPRINT_BITS
+
+
+class SimHashIndex:
+    """单个会话的SimHash指纹索引
+
+    指纹被切成若干段（band），每段各建一张哈希表。两个指纹的汉明距离小于段数时
+    必然有一段完全相同，所以查询只需要比较落在同一个桶里的候选，而不用扫描全部记忆。
+    默认8段，汉明距离不超过7（相似度约0.89以上）时保证不漏检；阈值再低一些时
+    漏检概率也很小，但不再是严格保证。
+    """
+
+    def __init__(self, bands: int = 8):
+        self.bands = bands
+        self.band_bits = FINGERPRINT_BITS // bands
+        self._band_mask = (1 << self.band_bits) - 1
+        self.fingerprints: Dict[str, int] = {}
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        return [(fingerprint >> (i * self.band_bits)) & self._band_mask for i in range(self.bands)]
+
+    def add(self, memory_id: str, content: str) -> int:
+        """加入一条记忆的指纹"""
+        self.remove(memory_id)
+        fingerprint = simhash(content)
+        self.fingerprints[memory_id] = fingerprint
+        for bucket, key in zip(self._buckets, self._band_keys(fingerprint)):
+            bucket.setdefault(key, set()).add(memory_id)
+        return fingerprint
+
+    def remove(self, memory_id: str):
+        """移除一条记忆的指纹"""
+        fingerprint = self.fingerprints.pop(memory_id, None)
+        if fingerprint is None:
+            return
+        for bucket, key in zip(self._buckets, self._band_keys(fingerprint)):
+            ids = bucket.get(key)
+            if ids is None:
+                continue
+            ids.discard(memory_id)
+            if not ids:
+                del bucket[key]
+
+    def query(self, fingerprint: int, threshold: float) -> List[Tuple[str, float]]:
+        """查找与指纹相似度不低于阈值的记忆，按相似度降序返回 (memory_id, 相似度)"""
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(fingerprint)):
+            candidates.update(bucket.get(key, ()))
+
+        results = []
+        for memory_id in candidates:
+            score = similarity(fingerprint, self.fingerprints[memory_id])
+            if score >= threshold:
+                results.append((memory_id, score))
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results
+
+    def find_similar(self, content: str, threshold: float) -> List[Tuple[str, float]]:
+        """查找与文本近似重复的记忆"""
+        return self.query(simhash(content), threshold)
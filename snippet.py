@@ -0,0 +1,70 @@
+import re
+from typing import List, Optional, Tuple
+
+Span = Tuple[int, int]
+
+
+def find_spans(text: str, keywords: List[str]) -> List[Span]:
+    """找出关键词在原文中的位置（不区分大小写），返回合并后的有序区间"""
+    keywords = [kw for kw in keywords if kw]
+    if not keywords:
+        return []
+
+    # 长关键词优先，避免短词抢先匹配掉长词的一部分
+    pattern = "|".join(re.escape(kw) for kw in sorted(set(keywords), key=len, reverse=True))
+    spans: List[Span] = []
+    for match in re.finditer(pattern, text, re.IGNORECASE):
+        start, end = match.span()
+        if spans and start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+    return spans
+
+
+def _highlight(text: str, spans: List[Span], start: int, end: int, marks: Tuple[str, str]) -> str:
+    """一次性输出 text[start:end]，并给落在其中的区间加上标记"""
+    parts = []
+    pos = start
+    for span_start, span_end in spans:
+        span_start, span_end = max(span_start, start), min(span_end, end)
+        if span_start >= span_end:
+            continue
+        parts.append(text[pos:span_start])
+        parts.append(marks[0] + text[span_start:span_end] + marks[1])
+        pos = span_end
+    parts.append(text[pos:end])
+    return "".join(parts)
+
+
+def render_snippet(text: str, spans: List[Span], width: Optional[int] = 30, max_windows: int = 3,
+                   marks: Tuple[str, str] = ("【", "】")) -> str:
+    """围绕命中位置截取片段并高亮
+
+    每个命中区间向两侧各扩展width个字符形成窗口，重叠的窗口合并，最多保留max_windows个，
+    窗口之间和被截掉的首尾用省略号表示。width为None时返回全文（仍然高亮）。
+    """
+    if width is None:
+        return _highlight(text, spans, 0, len(text), marks)
+
+    if not spans:
+        return text if len(text) <= width * 2 else text[:width * 2] + "..."
+
+    windows: List[Span] = []
+    for span_start, span_end in spans:
+        start, end = max(span_start - width, 0), min(span_end + width, len(text))
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+
+    pieces = []
+    for start, end in windows[:max_windows]:
+        piece = _highlight(text, spans, start, end, marks)
+        if start > 0:
+            piece = "..." + piece
+        pieces.append(piece)
+    snippet = "".join(pieces)
+    if windows[min(len(windows), max_windows) - 1][1] < len(text):
+        snippet += "..."
+    return snippet
@@ -0,0 +1,173 @@
+import re
+import bisect
+from typing import Dict, List, Optional, Iterator
+
+_TOKEN = re.compile(r"\(|\)|[^\s()]+")
+_OPERATORS = {"AND", "OR", "NOT"}
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    """依次返回位图中置位的下标"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class TagIndex:
+    """单个会话的标签位图索引
+
+    每个标签分配一个整数ID，每条记忆分配一个槽位；标签的倒排表是以槽位为下标的
+    位图（Python大整数），布尔查询就是位运算。删除记忆后槽位会回收复用，位图不会无限增长。
+    """
+
+    def __init__(self):
+        self.tag_ids: Dict[str, int] = {}
+        self.tag_names: List[str] = []
+        # 按字典序排好的标签名，前缀查询用二分定位
+        self._sorted_tags: List[str] = []
+        self.postings: Dict[int, int] = {}
+        self.slots: Dict[str, int] = {}
+        self.slot_ids: List[Optional[str]] = []
+        self._memory_tags: Dict[str, List[int]] = {}
+        self._free_slots: List[int] = []
+        self.all_bits = 0
+
+    def _tag_id(self, tag: str) -> int:
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = len(self.tag_names)
+            self.tag_ids[tag] = tag_id
+            self.tag_names.append(tag)
+            bisect.insort(self._sorted_tags, tag)
+        return tag_id
+
+    def add(self, memory_id: str, tags: List[str]):
+        """加入一条记忆"""
+        self.remove(memory_id)
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self.slot_ids[slot] = memory_id
+        else:
+            slot = len(self.slot_ids)
+            self.slot_ids.append(memory_id)
+        self.slots[memory_id] = slot
+
+        bit = 1 << slot
+        self.all_bits |= bit
+        tag_ids = [self._tag_id(tag) for tag in set(tags)]
+        for tag_id in tag_ids:
+            self.postings[tag_id] = self.postings.get(tag_id, 0) | bit
+        self._memory_tags[memory_id] = tag_ids
+
+    def remove(self, memory_id: str):
+        """移除一条记忆"""
+        slot = self.slots.pop(memory_id, None)
+        if slot is None:
+            return
+        bit = 1 << slot
+        self.all_bits &= ~bit
+        for tag_id in self._memory_tags.pop(memory_id):
+            self.postings[tag_id] &= ~bit
+        self.slot_ids[slot] = None
+        self._free_slots.append(slot)
+
+    def tag_counts(self) -> Dict[str, int]:
+        """每个标签下的记忆数量（不含已没有记忆的标签）"""
+        counts = {}
+        for tag_id, bits in self.postings.items():
+            if bits:
+                counts[self.tag_names[tag_id]] = bin(bits).count("1")
+        return counts
+
+    def all_tags(self) -> List[str]:
+        """仍有记忆的全部标签，按字典序"""
+        return [tag for tag in self._sorted_tags if self.postings.get(self.tag_ids[tag])]
+
+    def tag_bits(self, tag: str) -> int:
+        tag_id = self.tag_ids.get(tag)
+        return self.postings.get(tag_id, 0) if tag_id is not None else 0
+
+    def prefix_bits(self, prefix: str) -> int:
+        """所有以prefix开头的标签的并集"""
+        bits = 0
+        i = bisect.bisect_left(self._sorted_tags, prefix)
+        while i < len(self._sorted_tags) and self._sorted_tags[i].startswith(prefix):
+            bits |= self.postings.get(self.tag_ids[self._sorted_tags[i]], 0)
+            i += 1
+        return bits
+
+    def query(self, expression: str) -> List[str]:
+        """执行标签查询，返回命中记忆的ID
+
+        语法：标签之间用 AND / OR / NOT 组合，支持括号，相邻的标签默认为AND，
+        以 * 结尾表示前缀匹配。优先级 NOT > AND > OR。
+        例如：事件:* AND 人物:凌风 NOT 情感:恐惧
+        """
+        bits = _QueryParser(self, expression).parse()
+        return [self.slot_ids[slot] for slot in iter_bits(bits)]
+
+
+class _QueryParser:
+    """标签查询表达式的递归下降解析器，边解析边做位运算"""
+
+    def __init__(self, index: TagIndex, expression: str):
+        self.index = index
+        self.tokens = _TOKEN.findall(expression)
+        self.pos = 0
+        if not self.tokens:
+            raise ValueError("查询表达式为空")
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    def parse(self) -> int:
+        bits = self._or()
+        if self._peek() is not None:
+            raise ValueError(f"无法解析的内容: {self._peek()}")
+        return bits
+
+    def _or(self) -> int:
+        bits = self._and()
+        while self._peek() is not None and self._peek().upper() == "OR":
+            self._next()
+            bits |= self._and()
+        return bits
+
+    def _and(self) -> int:
+        bits = self._not()
+        while True:
+            token = self._peek()
+            if token is None or token == ")" or token.upper() == "OR":
+                return bits
+            if token.upper() == "AND":
+                self._next()
+            # "A NOT B" 这种相邻写法按 A AND NOT B 处理
+            bits &= self._not()
+
+    def _not(self) -> int:
+        token = self._peek()
+        if token is not None and token.upper() == "NOT":
+            self._next()
+            return self.index.all_bits & ~self._not()
+        return self._term()
+
+    def _term(self) -> int:
+        token = self._next()
+        if token is None:
+            raise ValueError("表达式不完整")
+        if token == "(":
+            bits = self._or()
+            if self._next() != ")":
+                raise ValueError("括号不匹配")
+            return bits
+        if token == ")" or token.upper() in _OPERATORS:
+            raise ValueError(f"这里需要一个标签，而不是 {token}")
+        if token.endswith("*"):
+            return self.index.prefix_bits(token[:-1])
+        return self.index.tag_bits(token)
@@ -0,0 +1,89 @@
+import re
+import bisect
+import datetime
+from typing import List, Optional, Tuple
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_RELATIVE = re.compile(r"^(\d+)\s*([mhdw])$", re.IGNORECASE)
+_UNIT_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_timestamp(timestamp: str) -> Optional[int]:
+    """把记忆的时间戳转换成秒级epoch，格式不对时返回None"""
+    try:
+        return int(datetime.datetime.strptime(timestamp, TIME_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_time_spec(spec: str, is_end: bool = False, now: Optional[datetime.datetime] = None) -> datetime.datetime:
+    """解析时间参数
+
+    支持相对时间（30m、24h、7d、2w，表示距今多久以前）、日期（2025-10-01）
+    和完整时间（2025-10-01 08:00:00）。只有日期且作为结束时间时取当天的最后一秒。
+    格式不对时抛出 ValueError。
+    """
+    spec = spec.strip()
+    now = now or datetime.datetime.now()
+
+    match = _RELATIVE.match(spec)
+    if match:
+        return now - datetime.timedelta(seconds=int(match.group(1)) * _UNIT_SECONDS[match.group(2).lower()])
+
+    for fmt in (TIME_FORMAT, "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            parsed = datetime.datetime.strptime(spec, fmt)
+        except ValueError:
+            continue
+        if fmt == "%Y-%m-%d" and is_end:
+            parsed += datetime.timedelta(days=1, seconds=-1)
+        return parsed
+
+    raise ValueError(f"无法识别的时间: {spec}（支持 7d / 24h / 30m / 2w、2025-10-01 或 2025-10-01 08:00:00）")
+
+
+class TimeIndex:
+    """单个会话按时间排序的索引
+
+    以 (epoch秒, memory_id) 有序列表存储，区间查询和按时间删除都用二分定位，
+    只触及区间内的元素。时间戳格式不对的记忆不进入索引。
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, memory_id: str, timestamp: str):
+        epoch = parse_timestamp(timestamp)
+        if epoch is not None:
+            bisect.insort(self.entries, (epoch, memory_id))
+
+    def remove(self, memory_id: str, timestamp: str):
+        epoch = parse_timestamp(timestamp)
+        if epoch is None:
+            return
+        i = bisect.bisect_left(self.entries, (epoch, memory_id))
+        if i < len(self.entries) and self.entries[i] == (epoch, memory_id):
+            del self.entries[i]
+
+    def _bounds(self, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        """区间 [start, end] 在有序列表中的下标范围"""
+        lo = 0 if start is None else bisect.bisect_left(self.entries, (start, ""))
+        # 同一秒内的条目按memory_id排序，以 (end+1, "") 作右边界才能把它们全部包含
+        hi = len(self.entries) if end is None else bisect.bisect_left(self.entries, (end + 1, ""))
+        return lo, hi
+
+    def between(self, start: Optional[int] = None, end: Optional[int] = None) -> List[str]:
+        """时间在 [start, end] 内的记忆ID，按时间升序"""
+        lo, hi = self._bounds(start, end)
+        return [memory_id for _, memory_id in self.entries[lo:hi]]
+
+    def pop_between(self, start: Optional[int] = None, end: Optional[int] = None) -> List[str]:
+        """删除并返回时间在 [start, end] 内的记忆ID"""
+        lo, hi = self._bounds(start, end)
+        removed = [memory_id for _, memory_id in self.entries[lo:hi]]
+        del self.entries[lo:hi]
+        return removed